@@ -2,6 +2,8 @@ from datetime import datetime, timedelta
 from jose import jwt
 from passlib.context import CryptContext
 
+import tokens
+
 SECRET_KEY = "Ea$yB1o"
 ALGORITHM = "HS256"
 
@@ -29,9 +31,5 @@ def _create_token(data: dict, expires_minutes: int):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 def decode_token(token: str):
-    from jose import JWTError
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload.get("sub")
-    except JWTError:
-        return None
+    payload = tokens.decode_token(token)
+    return payload.get("sub") if payload else None
@@ -0,0 +1,163 @@
+# benchmarks/bench_books_under_login.py
+# How much does a burst of logins stall a cheap route on the same worker?
+#
+# Drives main.app in-process (httpx ASGITransport over mongomock-motor, like bench_suite.py):
+# --logins POST /login requests at --concurrency, each a real bcrypt verify, while a probe
+# GETs /books every --probe-interval seconds. Each mode runs once:
+#
+#   inline    bcrypt.verify called on the event loop, as /login did before passwords.py
+#   thread    passwords.PasswordHasher with the thread backend
+#   process   passwords.PasswordHasher with the process backend
+#
+# /books latency is measured from when the probe meant to send it, so time spent waiting
+# for a blocked event loop counts.
+#
+#   python3 benchmarks/bench_books_under_login.py
+#   python3 benchmarks/bench_books_under_login.py --logins 80 --concurrency 16 --modes inline,thread
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = ("inline", "thread", "process")
+PASSWORD = "correct horse"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="/books latency under concurrent /login load, in-process against main.app.")
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4, help="PasswordHasher pool size")
+    parser.add_argument("--books", type=int, default=50)
+    parser.add_argument("--probe-interval", type=float, default=0.005)
+    parser.add_argument("--modes", default=",".join(MODES))
+    return parser.parse_args()
+
+
+args = parse_args()
+
+# Must be set before database/main are imported: both read their settings at import time
+os.environ.setdefault("MONGODB_URI", "mongodb://bench")
+os.environ.setdefault("CONTENT_WATCH_MODE", "off")
+
+import httpx
+from passlib.hash import bcrypt
+from mongomock_motor import AsyncMongoMockClient
+
+import database
+import main
+from passwords import PasswordHasher
+
+original_verify = main.verify_password
+
+
+async def inline_verify(plain, hashed):
+    # The pre-passwords.py path: bcrypt holds the event loop for the whole verify
+    return bcrypt.verify(plain, hashed)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def seed():
+    hashed = bcrypt.hash(PASSWORD)
+    students = await database.get_student_collection()
+    await students.insert_many([{
+        "name": f"Student {i}",
+        "phone": f"010{i:08d}",
+        "email": f"student{i}@bench.example",
+        "parent_phone": f"011{i:08d}",
+        "city": "Cairo",
+        "grade": next(iter(main.GRADE_MAP)),
+        "password": hashed,
+        "student_code": f"BENCH{i:05d}",
+    } for i in range(args.logins)])
+    books = await database.get_books_collection()
+    await books.insert_many([
+        {"id": i, "title": f"Book {i}", "price": "100 جنية", "image": f"https://cdn.example.com/books/{i}.png"}
+        for i in range(args.books)
+    ])
+
+
+async def run(client, mode: str) -> dict:
+    hasher = None
+    if mode == "inline":
+        main.verify_password = inline_verify
+    else:
+        main.verify_password = original_verify
+        hasher = main.password_hasher = PasswordHasher(backend=mode, workers=args.workers, max_pending=args.logins)
+        await hasher.warm_up()
+    # Sessions from the previous mode would count against MAX_ACTIVE_SESSIONS
+    await (await database.get_sessions_collection()).delete_many({})
+    # Served from the render cache from here on, as in production
+    await client.get("/books")
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, login_statuses = [], {}
+    done = asyncio.Event()
+
+    async def login(i):
+        async with semaphore:
+            response = await client.post("/login", json={"identifier": f"student{i}@bench.example", "password": PASSWORD})
+            login_statuses[response.status_code] = login_statuses.get(response.status_code, 0) + 1
+
+    async def probe():
+        while not done.is_set():
+            arrival = time.perf_counter() + args.probe_interval
+            await asyncio.sleep(args.probe_interval)
+            response = await client.get("/books")
+            response.raise_for_status()
+            latencies.append(max(0.0, time.perf_counter() - arrival) * 1000)
+
+    probe_task = asyncio.create_task(probe())
+    started = time.perf_counter()
+    await asyncio.gather(*(login(i) for i in range(args.logins)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await probe_task
+    if hasher is not None:
+        hasher.shutdown()
+    return {
+        "mode": mode,
+        "logins": args.logins,
+        "login_statuses": {str(code): n for code, n in sorted(login_statuses.items())},
+        "logins_per_sec": round(args.logins / elapsed, 1),
+        "books_samples": len(latencies),
+        "books_p50_ms": round(statistics.median(latencies), 3),
+        "books_p99_ms": round(percentile(latencies, 99), 3),
+        "books_max_ms": round(max(latencies), 3),
+    }
+
+
+async def main_async():
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        sys.exit(f"Unknown modes: {', '.join(sorted(unknown))}")
+
+    # Same startup as main.lifespan minus connect_to_mongo's ping / pool warm-up
+    database.db.client = AsyncMongoMockClient()
+    database.db.collections = {}
+    await database.ensure_indexes()
+    main.audit_sink.start(database.get_collection)
+    await main.token_blacklist.start()
+    try:
+        await seed()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            results = [await run(client, mode) for mode in modes]
+    finally:
+        await main.token_blacklist.stop()
+        await database.close_mongo_connection()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
@@ -0,0 +1,46 @@
+# benchmarks/bench_password_processes.py
+# Logins/sec (bcrypt verifications/sec) through passwords.PasswordHasher for the
+# thread and process backends at 1, 2, 4 and 8 workers.
+#
+#   python3 benchmarks/bench_password_processes.py [logins_per_run]
+import os
+import sys
+import json
+import time
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import PasswordHasher, _hash, BCRYPT_ROUNDS
+
+LOGINS = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+WORKER_COUNTS = (1, 2, 4, 8)
+
+
+async def run(backend: str, workers: int, hashed: str) -> dict:
+    hasher = PasswordHasher(backend=backend, workers=workers, max_pending=LOGINS)
+    await hasher.warm_up()
+    started = time.perf_counter()
+    results = await asyncio.gather(*(hasher.verify("correct horse", hashed) for _ in range(LOGINS)))
+    elapsed = time.perf_counter() - started
+    hasher.shutdown()
+    assert all(results)
+    return {
+        "backend": backend,
+        "workers": workers,
+        "logins": LOGINS,
+        "logins_per_sec": round(LOGINS / elapsed, 2),
+    }
+
+
+async def main():
+    hashed = _hash("correct horse", BCRYPT_ROUNDS["password"])
+    results = []
+    for backend in ("thread", "process"):
+        for workers in WORKER_COUNTS:
+            results.append(await run(backend, workers, hashed))
+    print(json.dumps({"cpu_count": os.cpu_count(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
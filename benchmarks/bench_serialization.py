@@ -0,0 +1,107 @@
+# benchmarks/bench_serialization.py
+# Time to turn a ROWS-long list into response bytes, before and after the orjson /
+# pydantic v2 response path:
+#   - raw Mongo documents (admin list routes): jsonable_encoder + json.dumps, the way
+#     FastAPI's default JSONResponse handled them, versus json_response.dumps
+#   - response_model lists (receipts, lessons): v1-style .dict() + jsonable_encoder +
+#     json.dumps versus the compiled TypeAdapter.dump_json FastAPI now uses
+#
+#   python3 benchmarks/bench_serialization.py [rows] [repeats]
+import os
+import sys
+import json
+import time
+import statistics
+from typing import List
+from datetime import datetime, timezone, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from pydantic import TypeAdapter
+from fastapi.encoders import jsonable_encoder
+
+from json_response import dumps
+from render_cache import render_lesson
+from schemas import ReceiptResponse, LessonResponseV2
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+REPEATS = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+
+def json_response_bytes(content) -> bytes:
+    # starlette.responses.JSONResponse.render
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def payment_docs() -> list:
+    started = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    return [{
+        "_id": ObjectId(),
+        "merchant_order_id": f"ORD-{i}",
+        "student_id": str(ObjectId()),
+        "student_code": f"S{i:05d}",
+        "item_type": "chapter",
+        "item_id": str(i % 40),
+        "amount": 100.0 + i % 7,
+        "status": "paid",
+        "payment_method": "card",
+        "created_at": started + timedelta(minutes=i),
+        "paymob_order_id": 500_000 + i,
+    } for i in range(ROWS)]
+
+
+def receipt_models() -> list:
+    return [ReceiptResponse(
+        _id=str(ObjectId()), student_id=str(ObjectId()), student_code=f"S{i:05d}", receipt_type="package_purchase",
+        item_id=str(i % 40), amount=100.0, description=f"Purchase of chapter {i % 40}",
+        created_at=datetime(2026, 1, 1) + timedelta(minutes=i)
+    ) for i in range(ROWS)]
+
+
+def lesson_models() -> list:
+    chapters = {str(c): {"title": f"Chapter {c}"} for c in range(40)}
+    return [render_lesson(i, {
+        "title": f"Lesson {i}", "chapter_id": i % 40, "price": f"{i % 9}0 جنية", "hours": 1.5,
+        "description": "وصف الدرس " * 4, "vimeo_embed_src": f"https://player.vimeo.com/video/{i}",
+        "image_url": f"https://cdn.example/{i}.jpg",
+    }, chapters) for i in range(ROWS)]
+
+
+def timed(fn) -> dict:
+    fn()  # warm-up
+    samples = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {"p50_ms": round(statistics.median(samples), 3), "min_ms": round(min(samples), 3)}
+
+
+def main():
+    results = {}
+
+    # ObjectIds are pre-stringified for "before": jsonable_encoder can't encode them at all
+    docs = payment_docs()
+    stringified = [{**doc, "_id": str(doc["_id"])} for doc in docs]
+    results["mongo_docs"] = {
+        "before": timed(lambda: json_response_bytes(jsonable_encoder(stringified))),
+        "after": timed(lambda: dumps(docs)),
+    }
+
+    for name, models, adapter in (
+        ("receipts", receipt_models(), TypeAdapter(List[ReceiptResponse])),
+        ("lessons", lesson_models(), TypeAdapter(List[LessonResponseV2])),
+    ):
+        results[name] = {
+            "before": timed(lambda: json_response_bytes(jsonable_encoder([m.model_dump(by_alias=True) for m in models]))),
+            "after": timed(lambda: adapter.dump_json(models, by_alias=True)),
+        }
+
+    for result in results.values():
+        result["speedup"] = round(result["before"]["p50_ms"] / result["after"]["p50_ms"], 1)
+    print(json.dumps({"rows": ROWS, "repeats": REPEATS, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
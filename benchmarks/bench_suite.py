@@ -0,0 +1,417 @@
+# benchmarks/bench_suite.py
+# Load-test suite for the main student-facing paths, run in-process against main.app
+# (httpx ASGITransport, so no network or uvicorn in the numbers) over generated data.
+#
+# Backends:
+#   mock    mongomock-motor swapped in for database.db.client (default; nothing to install
+#           beyond `pip install mongomock-motor httpx`). Good for comparing app-side cost
+#           between commits; Mongo-side cost (indexes, network) is not represented.
+#   mongod  a real local server at --mongodb-uri. The suite DROPS easybio_db there before
+#           seeding, so it refuses anything that isn't localhost.
+#
+# Scenarios: login, refresh, homepage, homepage_revalidate, my_chapters,
+# parent_dashboard, webhook. Each runs --requests requests at --concurrency and reports
+# p50/p95/p99/max latency and requests/sec as JSON. With --baseline, a previous output is
+# compared and the exit code is 1 when a scenario's p95 or RPS regressed past --tolerance.
+#
+#   python3 benchmarks/bench_suite.py
+#   python3 benchmarks/bench_suite.py --students 5000 --receipts 20000 --subjects 24 --output before.json
+#   python3 benchmarks/bench_suite.py --baseline before.json --scenarios homepage,my_chapters
+#   python3 benchmarks/bench_suite.py --backend mongod --mongodb-uri mongodb://localhost:27017
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from urllib.parse import urlparse
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCENARIOS = ("login", "refresh", "homepage", "homepage_revalidate", "my_chapters", "parent_dashboard", "webhook")
+PASSWORD = "bench-password"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="In-process load test of main.app over generated data.")
+    parser.add_argument("--backend", choices=("mock", "mongod"), default="mock")
+    parser.add_argument("--mongodb-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--receipts", type=int, default=10000)
+    parser.add_argument("--tests-per-student", type=int, default=3)
+    parser.add_argument("--subjects", type=int, default=12)
+    parser.add_argument("--chapters-per-subject", type=int, default=8)
+    parser.add_argument("--lessons-per-chapter", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--login-requests", type=int, default=200, help="bcrypt makes login far slower than the rest")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON report here")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95/RPS regression, as a fraction")
+    return parser.parse_args()
+
+
+args = parse_args()
+random.seed(args.seed)
+
+# Must be set before database/main are imported: both read their settings at import time
+if args.backend == "mongod":
+    if urlparse(args.mongodb_uri).hostname not in ("localhost", "127.0.0.1", "::1"):
+        sys.exit("--backend mongod drops easybio_db; point --mongodb-uri at a local server.")
+    os.environ["MONGODB_URI"] = args.mongodb_uri
+else:
+    os.environ.setdefault("MONGODB_URI", "mongodb://bench")
+os.environ.setdefault("CONTENT_WATCH_MODE", "off")
+
+import httpx
+
+import database
+import main
+from content_cache import content_cache
+from content_store import content_store
+from migrate_content import build_operations, write_in_batches
+
+
+# --- Data generator ---
+
+def generate_content(subjects: int, chapters_per_subject: int, lessons_per_chapter: int) -> tuple:
+    """Returns (content tree, subject paths, chapter ids). Chapter ids are unique across subjects."""
+    content, paths, chapter_ids = {}, [], []
+    chapter_id = 0
+    for s in range(subjects):
+        year, term, language = str(10 + s % 3), str(1 + s // 3 % 2), ("ar", "en")[s // 6 % 2]
+        subject = f"subject{s}"
+        chapters, lessons = {}, {}
+        for _ in range(chapters_per_subject):
+            chapter_id += 1
+            chapter_ids.append(chapter_id)
+            chapters[str(chapter_id)] = {"title": f"Chapter {chapter_id}", "price": f"{100 + chapter_id % 5 * 50} جنية"}
+            for lesson in range(lessons_per_chapter):
+                lesson_id = len(lessons) + 1
+                lessons[str(lesson_id)] = {
+                    "title": f"Lesson {lesson_id} of chapter {chapter_id}",
+                    "chapter_id": chapter_id,
+                    "price": f"{lesson % 4 * 20} جنية",
+                    "isFree": lesson % 4 == 0,
+                    "hours": 1.5,
+                    "description": "شرح تفصيلي للدرس مع أمثلة وتمارين محلولة. " * 3,
+                    "vimeo_embed_src": f"https://player.vimeo.com/video/{900000 + chapter_id * 100 + lesson}?h=abcdef0123&badge=0",
+                    "image_url": f"https://cdn.example.com/lessons/{chapter_id}/{lesson}.jpg",
+                    "lecture": f"Lecture {lesson + 1}",
+                }
+        content.setdefault(year, {}).setdefault(term, {}).setdefault(language, {})[subject] = {
+            "chapters": chapters, "lessons": lessons
+        }
+        paths.append((year, term, language, subject))
+    return content, paths, chapter_ids
+
+
+async def seed(password_hash: str) -> dict:
+    """Writes the generated dataset; returns what the scenarios need to address it."""
+    content, paths, chapter_ids = generate_content(args.subjects, args.chapters_per_subject, args.lessons_per_chapter)
+    edu = await database.get_educational_content_collection()
+    await edu.insert_one({"content": content})
+    if content_store.name == "collections":
+        # migrate_content.migrate() minus its own connect/close
+        chapter_ops, lesson_ops, _ = build_operations(content)
+        await write_in_batches(await database.get_chapters_collection(), chapter_ops)
+        await write_in_batches(await database.get_lessons_collection(), lesson_ops)
+        await content_store.bump_version()
+
+    grades = list(main.GRADE_MAP)
+    students = []
+    for i in range(args.students):
+        students.append({
+            "name": f"Student {i}",
+            "phone": f"010{i:08d}",
+            "email": f"student{i}@bench.example",
+            "parent_phone": f"011{i:08d}",
+            "city": "Cairo",
+            "grade": grades[i % len(grades)],
+            "lang": "ar",
+            "password": password_hash,
+            "student_code": f"B{i:07d}",
+        })
+    student_collection = await database.get_student_collection()
+    await student_collection.insert_many(students)
+
+    now = datetime.now(timezone.utc)
+    receipts, owned = [], {}
+    for i in range(args.receipts):
+        student = students[random.randrange(len(students))]
+        chapter_id = random.choice(chapter_ids)
+        owned.setdefault(student["student_code"], set()).add(chapter_id)
+        receipts.append({
+            "student_id": str(student["_id"]),
+            "student_code": student["student_code"],
+            "receipt_type": "package_purchase",
+            "item_id": str(chapter_id),
+            "amount": 150.0,
+            "description": f"Purchase of chapter {chapter_id}",
+            "created_at": now - timedelta(minutes=i),
+        })
+    if receipts:
+        await (await database.get_receipt_collection()).insert_many(receipts)
+    # What grant_from_receipt would have built up as those receipts were written
+    entitlements = [
+        {"_id": code, "chapter_ids": sorted(ids), "complete": True, "updated_at": now}
+        for code, ids in owned.items()
+    ]
+    if entitlements:
+        await (await database.get_entitlements_collection()).insert_many(entitlements)
+
+    tests = [
+        {
+            "id": n, "student_code": student["student_code"], "test_name": f"Quiz {n}", "score": f"{10 + n}/20",
+            "date_taken": "2026-01-01", "review_link": "https://example.com/review", "download_link": "https://example.com/pdf",
+        }
+        for student in students for n in range(args.tests_per_student)
+    ]
+    if tests:
+        await (await database.get_mock_test_results_collection()).insert_many(tests)
+
+    content_cache.invalidate()
+    return {"students": students, "paths": paths, "chapter_ids": chapter_ids}
+
+
+# --- Backends ---
+
+@asynccontextmanager
+async def backend():
+    if args.backend == "mongod":
+        async with main.lifespan(main.app):
+            await database.db.client.drop_database("easybio_db")
+            await database.ensure_indexes()
+            await content_store.ensure_indexes()
+            yield
+        return
+
+    from mongomock_motor import AsyncMongoMockClient
+    # Same startup as main.lifespan minus connect_to_mongo's ping / pool warm-up
+    database.db.client = AsyncMongoMockClient()
+    database.db.collections = {}
+    await database.ensure_indexes()
+    await content_store.ensure_indexes()
+    main.audit_sink.start(database.get_collection)
+    await main.password_hasher.warm_up()
+    await main.token_blacklist.start()
+    try:
+        yield
+    finally:
+        await main.token_blacklist.stop()
+        main.password_hasher.shutdown()
+        await database.close_mongo_connection()
+
+
+# --- Scenarios ---
+# Each is (setup, request): setup(client, data, workers) returns one state object per
+# worker; request(client, state, i) sends the i-th request and returns the response.
+
+async def no_setup(client, data, workers):
+    return [None] * workers
+
+
+def random_student(data):
+    return random.choice(data["students"])
+
+
+async def login(client, state, i):
+    student = random_student(DATA)
+    return await client.post("/login", json={"identifier": student["email"], "password": PASSWORD})
+
+
+async def refresh_setup(client, data, workers):
+    # One logged-in session per worker; each refresh rotates that worker's token
+    states = []
+    for w in range(workers):
+        student = data["students"][w % len(data["students"])]
+        response = await client.post("/login", json={"identifier": student["email"], "password": PASSWORD})
+        states.append({"refresh_token": response.json()["refresh_token"]})
+    return states
+
+
+async def refresh(client, state, i):
+    response = await client.post("/token/refresh", headers={"Cookie": f"refresh_token={state['refresh_token']}"})
+    if response.status_code == 200:
+        state["refresh_token"] = response.json()["refresh_token"]
+    return response
+
+
+def homepage_url(i):
+    year, term, language, subject = DATA["paths"][i % len(DATA["paths"])]
+    return f"/homepage/{year}/{term}/{language}/{subject}" + ("", "/free", "/paid")[i // len(DATA["paths"]) % 3]
+
+
+async def homepage(client, state, i):
+    return await client.get(homepage_url(i))
+
+
+async def homepage_revalidate_setup(client, data, workers):
+    etags = {}
+    for i in range(len(data["paths"]) * 3):
+        url = homepage_url(i)
+        etags[url] = (await client.get(url)).headers.get("etag")
+    return [etags] * workers
+
+
+async def homepage_revalidate(client, etags, i):
+    url = homepage_url(i)
+    return await client.get(url, headers={"If-None-Match": etags[url]})
+
+
+async def my_chapters_setup(client, data, workers):
+    tokens = [main.create_access_token(str(s["_id"]), s) for s in data["students"][:max(workers * 4, 1)]]
+    return [tokens] * workers
+
+
+async def my_chapters(client, tokens, i):
+    return await client.get("/dashboard/my-chapters", headers={"Authorization": f"Bearer {tokens[i % len(tokens)]}"})
+
+
+async def parent_dashboard(client, state, i):
+    student = random_student(DATA)
+    return await client.post("/parent/dashboard", json={"student_phone": student["phone"], "parent_phone": student["parent_phone"]})
+
+
+async def webhook_setup(client, data, workers):
+    # One pending payment per request, paid by its callback
+    payments = await database.get_payments_collection()
+    docs = []
+    for i in range(args.requests):
+        student = data["students"][i % len(data["students"])]
+        docs.append({
+            "merchant_order_id": f"ORD-SUITE-{i}",
+            "student_id": str(student["_id"]),
+            "student_code": student["student_code"],
+            "item_type": "chapter",
+            "item_id": str(random.choice(data["chapter_ids"])),
+            "amount": 150.0,
+            "status": "pending",
+            "payment_method": "card",
+            "created_at": datetime.now(timezone.utc),
+        })
+    await payments.insert_many(docs)
+    return [None] * workers
+
+
+async def webhook(client, state, i):
+    return await client.post("/payments/webhook", json={"merchant_order_id": f"ORD-SUITE-{i}", "success": True, "id": 2_000_000 + i})
+
+
+SCENARIO_FUNCS = {
+    "login": (no_setup, login),
+    "refresh": (refresh_setup, refresh),
+    "homepage": (no_setup, homepage),
+    "homepage_revalidate": (homepage_revalidate_setup, homepage_revalidate),
+    "my_chapters": (my_chapters_setup, my_chapters),
+    "parent_dashboard": (no_setup, parent_dashboard),
+    "webhook": (webhook_setup, webhook),
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_scenario(client, name: str, requests: int) -> dict:
+    setup, request = SCENARIO_FUNCS[name]
+    states = await setup(client, DATA, args.concurrency)
+    latencies, statuses = [], {}
+    next_index = iter(range(requests))
+
+    async def worker(state):
+        for i in next_index:
+            started = time.perf_counter()
+            response = await request(client, state, i)
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(state) for state in states))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "concurrency": args.concurrency,
+        "statuses": {str(code): n for code, n in sorted(statuses.items())},
+        "errors": sum(n for code, n in statuses.items() if code >= 400),
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(max(latencies), 3),
+    }
+
+
+def compare(report: dict, baseline: dict) -> list:
+    """Scenarios whose p95 grew or RPS dropped by more than the tolerance."""
+    regressions = []
+    for name, result in report["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        if result["p95_ms"] > before["p95_ms"] * (1 + args.tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']} -> {result['p95_ms']} ms")
+        if result["rps"] < before["rps"] * (1 - args.tolerance):
+            regressions.append(f"{name}: rps {before['rps']} -> {result['rps']}")
+        if result["errors"] > before["errors"]:
+            regressions.append(f"{name}: errors {before['errors']} -> {result['errors']}")
+    return regressions
+
+
+DATA = {}
+
+
+async def main_async() -> int:
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    async with backend():
+        seeding_started = time.perf_counter()
+        # One hash for every student: seeding stays fast, logins still pay full bcrypt cost
+        DATA.update(await seed(await main.hash_password(PASSWORD)))
+        seed_seconds = time.perf_counter() - seeding_started
+
+        report = {
+            "backend": args.backend,
+            "dataset": {
+                "students": args.students,
+                "receipts": args.receipts,
+                "subjects": args.subjects,
+                "chapters": len(DATA["chapter_ids"]),
+                "lessons": args.subjects * args.chapters_per_subject * args.lessons_per_chapter,
+                "seed_seconds": round(seed_seconds, 2),
+            },
+            "scenarios": {},
+        }
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name in names:
+                requests = args.login_requests if name == "login" else args.requests
+                report["scenarios"][name] = await run_scenario(client, name, requests)
+                print(f"{name}: {report['scenarios'][name]['rps']} rps", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f))
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main_async()))
@@ -0,0 +1,109 @@
+# benchmarks/bench_webhook_replay.py
+# Replays every Paymob callback DUPLICATES times, concurrently and shuffled, against
+# main.app backed by an in-memory Mongo stand-in (mongomock-motor), then checks that
+# each paid order produced exactly one receipt.
+#
+#   pip install mongomock-motor httpx
+#   python3 benchmarks/bench_webhook_replay.py [orders] [duplicates] [concurrency]
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import statistics
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGODB_URI", "mongodb://bench")
+os.environ.setdefault("CONTENT_WATCH_MODE", "off")
+
+import httpx
+from mongomock_motor import AsyncMongoMockClient
+
+import database
+import main
+
+ORDERS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+DUPLICATES = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+CONCURRENCY = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+FAILED_SHARE = 0.1
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def seed() -> list:
+    payments = await database.get_payments_collection()
+    orders = []
+    for i in range(ORDERS):
+        merchant_order_id = f"ORD-BENCH-{i}"
+        await payments.insert_one({
+            "merchant_order_id": merchant_order_id,
+            "student_id": None,
+            "student_code": f"S{i % 97:05d}",
+            "item_type": "chapter",
+            "item_id": str(1 + i % 10),
+            "amount": 100.0,
+            "status": "pending",
+            "payment_method": "card",
+            "created_at": datetime.now(timezone.utc),
+        })
+        orders.append(merchant_order_id)
+    return orders
+
+
+async def main_async():
+    database.db.client = AsyncMongoMockClient()
+    await database.ensure_indexes()
+    orders = await seed()
+    # Some orders get a failure callback first, then retried successes
+    deliveries = []
+    for i, merchant_order_id in enumerate(orders):
+        if i < ORDERS * FAILED_SHARE:
+            deliveries.append({"merchant_order_id": merchant_order_id, "success": False, "id": 10_000_000 + i})
+        deliveries += [{"merchant_order_id": merchant_order_id, "success": True, "id": 1_000_000 + i}] * DUPLICATES
+    random.shuffle(deliveries)
+
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    latencies, statuses = [], {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def deliver(payload):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post("/payments/webhook", json=payload)
+                latencies.append((time.perf_counter() - started) * 1000)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(deliver(payload) for payload in deliveries))
+        elapsed = time.perf_counter() - started
+
+    receipts = await database.get_receipt_collection()
+    payments = await database.get_payments_collection()
+    receipt_count = await receipts.count_documents({})
+    paid = await payments.count_documents({"status": "paid"})
+    duplicated_orders = await receipts.aggregate([
+        {"$group": {"_id": "$merchant_order_id", "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+    ]).to_list(None)
+    print(json.dumps({
+        "orders": ORDERS,
+        "deliveries": len(deliveries),
+        "concurrency": CONCURRENCY,
+        "statuses": statuses,
+        "webhooks_per_sec": round(len(deliveries) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "paid_orders": paid,
+        "receipts": receipt_count,
+        "orders_with_duplicate_receipts": len(duplicated_orders),
+    }, indent=2))
+    assert paid == ORDERS and receipt_count == ORDERS and not duplicated_orders
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
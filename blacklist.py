@@ -0,0 +1,197 @@
+# blacklist.py
+import os
+import math
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+
+from database import get_token_blacklist_collection
+from tokens import token_hash
+
+# Sized for this many revoked tokens at the target false-positive rate; past that the
+# filter is rebuilt from Mongo (which also drops tokens whose TTL has removed them)
+BLACKLIST_BLOOM_CAPACITY = int(os.environ.get("BLACKLIST_BLOOM_CAPACITY", "100000"))
+BLACKLIST_BLOOM_FPR = float(os.environ.get("BLACKLIST_BLOOM_FPR", "0.001"))
+# How often to pull revocations made by other workers, and to rebuild from scratch
+BLACKLIST_SYNC_SECONDS = float(os.environ.get("BLACKLIST_SYNC_SECONDS", "30"))
+BLACKLIST_REBUILD_SECONDS = float(os.environ.get("BLACKLIST_REBUILD_SECONDS", "3600"))
+# Syncs follow the server-assigned created_at. A revocation can become visible after one with
+# a later timestamp was already read, so each sync reads this far back again
+BLACKLIST_SYNC_OVERLAP_SECONDS = float(os.environ.get("BLACKLIST_SYNC_OVERLAP_SECONDS", "120"))
+# A rebuilt filter is sized for this many times the live entries, so it doesn't start out full
+BLACKLIST_BLOOM_GROWTH = float(os.environ.get("BLACKLIST_BLOOM_GROWTH", "2"))
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over hex digests (no false negatives, tunable false positives)."""
+
+    def __init__(self, capacity: int, fpr: float):
+        self.capacity = max(1, capacity)
+        self.fpr = fpr
+        self.size = max(8, int(math.ceil(-self.capacity * math.log(fpr) / (math.log(2) ** 2))))
+        self.hashes = max(1, int(round(self.size / self.capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest: str):
+        # Double hashing (Kirsch-Mitzenmacher) from two halves of a second digest
+        raw = hashlib.blake2b(digest.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(raw[:8], "big")
+        h2 = int.from_bytes(raw[8:], "big") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, digest: str):
+        for pos in self._positions(digest):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, digest: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(digest))
+
+    def estimated_fpr(self) -> float:
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+class TokenBlacklist:
+    """Revoked refresh tokens, with an in-process Bloom filter in front of token_blacklist.
+
+    A miss in the filter means the token was never revoked (as of the last sync), so
+    Mongo is only asked when the filter says "maybe".
+    """
+
+    def __init__(self, capacity: int = BLACKLIST_BLOOM_CAPACITY, fpr: float = BLACKLIST_BLOOM_FPR):
+        self.capacity = capacity
+        self.fpr = fpr
+        self.bloom = BloomFilter(capacity, fpr)
+        self._synced_to = None      # newest created_at loaded so far
+        self._recent = {}           # token_hash -> created_at of entries inside the overlap window
+        self._last_rebuild = None
+        self._task = None
+        self.checks = 0
+        self.filter_negatives = 0
+        self.db_lookups = 0
+        self.false_positives = 0
+        self.rebuilds = 0
+
+    async def _load(self, query: dict) -> list:
+        """Returns [(token_hash, created_at), ...] of the matching entries."""
+        collection = await get_token_blacklist_collection()
+        entries = []
+        async for doc in collection.find(query, {"token_hash": 1, "token": 1, "created_at": 1}):
+            digest = doc.get("token_hash")
+            if digest is None and doc.get("token"):
+                # Entry from before tokens were stored hashed; convert it in place
+                digest = token_hash(doc["token"])
+                await collection.update_one({"_id": doc["_id"]}, {"$set": {"token_hash": digest}, "$unset": {"token": ""}})
+            if digest:
+                entries.append((digest, doc.get("created_at")))
+        return entries
+
+    def _add(self, entries: list):
+        for digest, created_at in entries:
+            # The overlap window returns the same entries sync after sync; count each once
+            if digest in self._recent:
+                continue
+            self.bloom.add(digest)
+            if created_at is not None:
+                self._recent[digest] = created_at
+                if self._synced_to is None or created_at > self._synced_to:
+                    self._synced_to = created_at
+        if self._synced_to is not None:
+            cutoff = self._synced_to - timedelta(seconds=BLACKLIST_SYNC_OVERLAP_SECONDS)
+            self._recent = {digest: at for digest, at in self._recent.items() if at >= cutoff}
+
+    async def rebuild(self):
+        entries = await self._load({})
+        # Sized from the live entries: a filter rebuilt at its old capacity would be full again at once
+        capacity = max(self.capacity, int(len(entries) * BLACKLIST_BLOOM_GROWTH))
+        self.bloom = BloomFilter(capacity, self.fpr)
+        self._synced_to = None
+        self._recent = {}
+        self._add(entries)
+        self._last_rebuild = asyncio.get_running_loop().time()
+        self.rebuilds += 1
+
+    async def sync(self):
+        """Adds entries written since the last load (e.g. by other workers)."""
+        if self._synced_to is None:
+            query = {}
+        else:
+            query = {"created_at": {"$gte": self._synced_to - timedelta(seconds=BLACKLIST_SYNC_OVERLAP_SECONDS)}}
+        self._add(await self._load(query))
+
+    async def revoke(self, token: str, expire_at: datetime):
+        digest = token_hash(token)
+        collection = await get_token_blacklist_collection()
+        # created_at comes from the server clock so every worker's entries sort on one timeline
+        doc = await collection.find_one_and_update(
+            {"token_hash": digest},
+            {"$setOnInsert": {"expire_at": expire_at}, "$currentDate": {"created_at": True}},
+            projection={"created_at": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._add([(digest, doc["created_at"])])
+
+    async def is_revoked(self, token: str) -> bool:
+        self.checks += 1
+        digest = token_hash(token)
+        if digest not in self.bloom:
+            self.filter_negatives += 1
+            return False
+        self.db_lookups += 1
+        collection = await get_token_blacklist_collection()
+        if await collection.find_one({"token_hash": digest}, {"_id": 1}):
+            return True
+        self.false_positives += 1
+        return False
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(BLACKLIST_SYNC_SECONDS)
+            try:
+                elapsed = asyncio.get_running_loop().time() - self._last_rebuild
+                if self.bloom.count >= self.bloom.capacity or elapsed >= BLACKLIST_REBUILD_SECONDS:
+                    await self.rebuild()
+                else:
+                    await self.sync()
+            except Exception as e:
+                print(f"Token blacklist sync failed: {e}")
+
+    async def start(self):
+        await self.rebuild()
+        if BLACKLIST_SYNC_SECONDS > 0 and self._task is None:
+            self._task = asyncio.create_task(self._sync_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        # Every check that Mongo didn't confirm was a token that isn't revoked
+        not_revoked = self.filter_negatives + self.false_positives
+        return {
+            "items": self.bloom.count,
+            "capacity": self.bloom.capacity,
+            "bits": self.bloom.size,
+            "hashes": self.bloom.hashes,
+            "memory_bytes": len(self.bloom.bits),
+            "target_fpr": self.bloom.fpr,
+            "estimated_fpr": round(self.bloom.estimated_fpr(), 6),
+            "checks": self.checks,
+            "filter_negatives": self.filter_negatives,
+            "db_lookups": self.db_lookups,
+            "false_positives": self.false_positives,
+            "observed_fpr": round(self.false_positives / not_revoked, 6) if not_revoked else None,
+            "rebuilds": self.rebuilds,
+        }
+
+
+token_blacklist = TokenBlacklist()
@@ -0,0 +1,202 @@
+# compression.py
+import os
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from starlette.datastructures import Headers, MutableHeaders
+
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "1") == "1"
+# Bodies smaller than this go out as is; below ~1 KB the saving is lost in packet overhead
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+# brotli is in requirements.txt; without it (e.g. a trimmed install) only gzip is offered
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "5"))
+# Quality for payloads compressed once and cached (see RenderedPayload.encoded)
+BROTLI_CACHED_QUALITY = int(os.environ.get("BROTLI_CACHED_QUALITY", "11"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/x-ndjson", "image/svg+xml")
+
+
+def _accepted(accept_encoding: str) -> dict:
+    """Parses Accept-Encoding into {coding: q}."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+class Compressor:
+    """Content negotiation, compression and byte counters shared by the middleware and render_cache."""
+
+    def __init__(self, enabled: bool = COMPRESSION_ENABLED, min_bytes: int = COMPRESSION_MIN_BYTES,
+                 gzip_level: int = GZIP_LEVEL, brotli_quality: int = BROTLI_QUALITY,
+                 brotli_cached_quality: int = BROTLI_CACHED_QUALITY):
+        self.enabled = enabled
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.brotli_cached_quality = brotli_cached_quality
+        self.encodings = ("br", "gzip") if brotli is not None else ("gzip",)
+        self.responses = {}         # coding -> responses sent compressed
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.skipped_small = 0
+
+    def choose(self, accept_encoding: str):
+        """Returns the coding to use for a client, or None for identity."""
+        if not self.enabled:
+            return None
+        accepted = _accepted(accept_encoding)
+        for coding in self.encodings:
+            q = accepted.get(coding, accepted.get("*", 0.0))
+            if q > 0:
+                return coding
+        return None
+
+    def compress(self, body: bytes, coding: str, cached: bool = False) -> bytes:
+        if coding == "br":
+            return brotli.compress(body, quality=self.brotli_cached_quality if cached else self.brotli_quality)
+        # mtime=0 keeps the output identical across workers, so cached variants share an ETag
+        return gzip.compress(body, compresslevel=9 if cached else self.gzip_level, mtime=0)
+
+    def streamer(self, coding: str):
+        """Returns an object with compress(chunk) and flush() for streamed bodies."""
+        if coding == "br":
+            return _BrotliStream(brotli.Compressor(quality=self.brotli_quality))
+        return zlib.compressobj(self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def count(self, coding: str, size_in: int, size_out: int):
+        self.responses[coding] = self.responses.get(coding, 0) + 1
+        self.bytes_in += size_in
+        self.bytes_out += size_out
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "encodings": list(self.encodings),
+            "min_bytes": self.min_bytes,
+            "responses": dict(self.responses),
+            "skipped_small": self.skipped_small,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else None,
+        }
+
+
+class _BrotliStream:
+    def __init__(self, compressor):
+        self._compressor = compressor
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.process(chunk)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """Compresses response bodies the client accepts, gzip or brotli.
+
+    Responses that already carry Content-Encoding (the pre-compressed catalog payloads),
+    non-text types and single-message bodies under min_bytes pass through untouched.
+    Streamed bodies (exports) are compressed chunk by chunk.
+    """
+
+    def __init__(self, app, compressor: Compressor):
+        self.app = app
+        self.compressor = compressor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.compressor.enabled:
+            await self.app(scope, receive, send)
+            return
+        coding = self.compressor.choose(Headers(scope=scope).get("accept-encoding"))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressedResponse(self.app, self.compressor, coding)(scope, receive, send)
+
+
+class _CompressedResponse:
+    def __init__(self, app, compressor: Compressor, coding: str):
+        self.app = app
+        self.compressor = compressor
+        self.coding = coding
+        self.start = None
+        self.active = None          # None until the first body message decides it
+        self.stream = None
+        self.size_in = 0
+        self.size_out = 0
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.wrapped_send)
+
+    def _compressible(self) -> bool:
+        headers = Headers(raw=self.start["headers"])
+        if "content-encoding" in headers or self.start["status"] in (204, 304):
+            return False
+        return headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+
+    async def wrapped_send(self, message):
+        if message["type"] == "http.response.start":
+            # Held back until we know whether the body will be compressed
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.active is None:
+            compressible = self._compressible()
+            self.active = compressible and (more_body or len(body) >= self.compressor.min_bytes)
+            if compressible and not self.active:
+                self.compressor.skipped_small += 1
+            headers = MutableHeaders(raw=self.start["headers"])
+            if compressible:
+                headers.add_vary_header("Accept-Encoding")
+            if self.active:
+                headers["Content-Encoding"] = self.coding
+                if not more_body:
+                    compressed = self.compressor.compress(body, self.coding)
+                    self.compressor.count(self.coding, len(body), len(compressed))
+                    headers["Content-Length"] = str(len(compressed))
+                    await self.send(self.start)
+                    await self.send({"type": "http.response.body", "body": compressed})
+                    return
+                del headers["Content-Length"]
+                self.stream = self.compressor.streamer(self.coding)
+            await self.send(self.start)
+
+        if not self.active:
+            await self.send(message)
+            return
+
+        self.size_in += len(body)
+        chunk = self.stream.compress(body)
+        if not more_body:
+            chunk += self.stream.flush()
+            self.compressor.count(self.coding, self.size_in, self.size_out + len(chunk))
+        self.size_out += len(chunk)
+        await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+
+compressor = Compressor()
@@ -0,0 +1,212 @@
+# content_cache.py
+import os
+import asyncio
+from datetime import datetime, timezone
+
+from pymongo.errors import OperationFailure
+
+from content_store import content_store
+from singleflight import SingleFlight
+
+# "auto" tries a change stream and falls back to polling, "off" disables the watcher
+CONTENT_WATCH_MODE = os.environ.get("CONTENT_WATCH_MODE", "auto")
+CONTENT_POLL_SECONDS = float(os.environ.get("CONTENT_POLL_SECONDS", "5"))
+# Longest wait before reopening a change stream that failed; the wait doubles from 1s up to this
+CONTENT_WATCH_RETRY_MAX_SECONDS = float(os.environ.get("CONTENT_WATCH_RETRY_MAX_SECONDS", "30"))
+
+# Server errors meaning change streams aren't available at all (standalone / too old a server)
+CHANGE_STREAMS_UNSUPPORTED = {40573, 40324}
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ContentIndex:
+    """Lookup tables over the content tree so routes don't walk year -> term -> language -> subject.
+
+    Chapter and lesson ids are only unique within a subject, so chapter entries keep every
+    (path, chapter) pair in tree order; lessons resolve to the first match like the old scans did.
+    """
+
+    def __init__(self, content: dict):
+        self.subjects = {}          # (year, term, language, subject) -> subject node
+        self.lessons = {}           # lesson_id (str) -> (path, lesson)
+        self.chapters = {}          # chapter_id (int) -> [(path, chapter), ...]
+        self.chapter_lessons = {}   # chapter_id (int) -> [(path, lesson_id, lesson), ...]
+        for year, year_content in content.items():
+            for term, term_content in year_content.items():
+                for language, lang_content in term_content.items():
+                    for subject, subject_content in lang_content.items():
+                        path = (year, term, language, subject)
+                        self.subjects[path] = subject_content
+                        for cid, chapter in subject_content.get("chapters", {}).items():
+                            chapter_id = _as_int(cid)
+                            if chapter_id is not None:
+                                self.chapters.setdefault(chapter_id, []).append((path, chapter))
+                        for lid, lesson in subject_content.get("lessons", {}).items():
+                            self.lessons.setdefault(str(lid), (path, lesson))
+                            chapter_id = _as_int(lesson.get("chapter_id"))
+                            if chapter_id is not None:
+                                self.chapter_lessons.setdefault(chapter_id, []).append((path, lid, lesson))
+
+    def chapter(self, chapter_id: int):
+        """Returns the first (path, chapter) for the id, or None."""
+        entries = self.chapters.get(chapter_id)
+        return entries[0] if entries else None
+
+    def lesson(self, lesson_id):
+        """Returns (path, lesson) for the id, or None."""
+        return self.lessons.get(str(lesson_id))
+
+    def chapter_title(self, path: tuple, chapter_id):
+        subject_content = self.subjects.get(path, {})
+        return subject_content.get("chapters", {}).get(str(chapter_id), {}).get("title")
+
+
+class ContentCache:
+    """In-process copy of the educational content tree, reloaded only when its version changes."""
+
+    def __init__(self):
+        self.content = None
+        self.index = None
+        self.version = None
+        self.loaded_at = None
+        self.stale = True
+        self.hits = 0
+        self.misses = 0
+        self.stale_reads = 0
+        self.reloads = 0
+        self.invalidations = 0
+        self.watch_mode = None
+        self.watch_errors = 0
+        self._flight = SingleFlight("content")
+        self._loaded_generation = -1    # invalidation count when the current content's load started
+        self._watcher = None
+
+    async def get(self):
+        """Returns the cached content dict, or None when no content document exists."""
+        if not self.stale:
+            self.hits += 1
+            return self.content
+        self.misses += 1
+        if self.loaded_at is not None:
+            self.stale_reads += 1
+        await self.refresh()
+        return self.content
+
+    async def get_index(self):
+        """Returns the ContentIndex for the cached content, or None when no content document exists."""
+        await self.get()
+        return self.index
+
+    async def refresh(self):
+        # Every request that finds the cache stale while a load is running awaits that load.
+        # A load that started before the invalidation this caller saw may have read the old
+        # document, so joining it isn't enough: go round again until one started after it.
+        wanted = self.invalidations
+        while self._loaded_generation < wanted:
+            await self._flight.do("content", self._load)
+
+    async def _load(self):
+        if not self.stale:
+            return
+        generation = self.invalidations
+        self.content, self.version = await content_store.load()
+        self._loaded_generation = generation
+        self.index = ContentIndex(self.content) if self.content is not None else None
+        self.loaded_at = datetime.now(timezone.utc)
+        # An invalidation that arrived mid-load means what we just read may already be old
+        self.stale = self.invalidations != generation
+        self.reloads += 1
+
+    def invalidate(self):
+        self.stale = True
+        self.invalidations += 1
+
+    # --- Change watcher ---
+
+    def start_watcher(self):
+        if CONTENT_WATCH_MODE == "off" or self._watcher:
+            return
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def stop_watcher(self):
+        if self._watcher:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+    async def _watch(self):
+        """Runs until stop_watcher(): a lost stream is reopened, never left closed."""
+        if CONTENT_WATCH_MODE in ("auto", "change_stream"):
+            delay = 1.0
+            while True:
+                try:
+                    await self._watch_change_stream()
+                    print("Content change stream closed; reopening.")
+                    delay = 1.0
+                except OperationFailure as e:
+                    if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                        # Change streams need a replica set; standalone servers end up here
+                        print(f"Content change stream unavailable ({e}); falling back to polling.")
+                        break
+                    delay = await self._watch_failed(e, delay)
+                except Exception as e:
+                    # Network errors, failovers, ... : the content may change while we're not watching
+                    delay = await self._watch_failed(e, delay)
+        await self._poll_version()
+
+    async def _watch_failed(self, error, delay: float) -> float:
+        self.watch_errors += 1
+        print(f"Content change stream failed ({error}); reopening in {delay:.0f}s.")
+        await asyncio.sleep(delay)
+        # Edits made while the stream was down never reach it, so reload once to catch up
+        self.invalidate()
+        return min(delay * 2, CONTENT_WATCH_RETRY_MAX_SECONDS)
+
+    async def _watch_change_stream(self):
+        self.watch_mode = "change_stream"
+        collection = await content_store.watch_collection()
+        async with collection.watch() as stream:
+            async for _ in stream:
+                self.invalidate()
+
+    async def _poll_version(self):
+        self.watch_mode = "poll"
+        while True:
+            await asyncio.sleep(CONTENT_POLL_SECONDS)
+            try:
+                version = await content_store.read_version()
+            except Exception as e:
+                self.watch_errors += 1
+                print(f"Content version poll failed: {e}")
+                continue
+            if version != self.version and not self.stale:
+                self.invalidate()
+
+    def stats(self) -> dict:
+        reads = self.hits + self.misses
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+            "stale": self.stale,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_reads": self.stale_reads,
+            "reloads": self.reloads,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / reads, 4) if reads else None,
+            "watch_mode": self.watch_mode,
+            "watch_errors": self.watch_errors,
+            "backend": content_store.name,
+        }
+
+
+content_cache = ContentCache()
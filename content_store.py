@@ -0,0 +1,375 @@
+# content_store.py
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from database import (
+    CONTENT_BACKEND,
+    get_educational_content_collection,
+    get_chapters_collection,
+    get_lessons_collection,
+    get_content_meta_collection,
+    get_counters_collection,
+)
+
+# The single document that holds the year/term/language/subject tree
+CONTENT_FILTER = {"content": {"$exists": True}}
+# _id given to that document when a write has to create it; a fixed key lets concurrent first
+# writes upsert the same document instead of inserting one each
+CONTENT_DOCUMENT_ID = "content"
+# Bumped with $inc by every admin content write so other workers notice the change
+CONTENT_VERSION_FIELD = "content_version"
+
+SUBJECT_FIELDS = ("year", "term", "language", "subject")
+# Hides the key fields so stored chapters / lessons look like the nodes of the content tree
+NODE_PROJECTION = {"_id": 0, "year": 0, "term": 0, "language": 0, "subject": 0, "id": 0}
+MAX_ID_ATTEMPTS = 5
+
+
+class ChapterNotFound(Exception):
+    """Raised when a lesson points at a chapter_id that doesn't exist in its subject."""
+
+
+def _subject_filter(path: tuple) -> dict:
+    return dict(zip(SUBJECT_FIELDS, path))
+
+
+def _counter_name(kind: str, path: tuple) -> str:
+    return ":".join((kind,) + tuple(path))
+
+
+async def reseed_counter(name: str, value: int) -> None:
+    counters = await get_counters_collection()
+    await counters.update_one({"_id": name}, {"$max": {"seq": value}}, upsert=True)
+
+
+async def allocate_id(name: str, seed) -> int:
+    """Returns the next id of the named sequence.
+
+    The first call for a sequence seeds it from `seed()` (the current max id); $max keeps
+    concurrent seeders from moving it backwards, and $inc hands every caller a distinct id.
+    """
+    counters = await get_counters_collection()
+    doc = await counters.find_one_and_update({"_id": name}, {"$inc": {"seq": 1}}, return_document=ReturnDocument.AFTER)
+    if doc is None:
+        await reseed_counter(name, await seed())
+        doc = await counters.find_one_and_update({"_id": name}, {"$inc": {"seq": 1}}, return_document=ReturnDocument.AFTER)
+    return doc["seq"]
+
+
+class DocumentContentStore:
+    """Keeps the whole catalog in the single educational_content document.
+
+    Writes only touch the changed node through dotted paths such as
+    content.12.1.ar.bio.lessons.7, so two admins editing different lessons don't overwrite each other.
+    """
+
+    name = "document"
+
+    async def ensure_indexes(self):
+        pass
+
+    async def load(self):
+        """Returns (content tree, version), or (None, None) when no content document exists."""
+        edu_collection = await get_educational_content_collection()
+        doc = await edu_collection.find_one(CONTENT_FILTER)
+        if not doc:
+            return None, None
+        return doc.get("content", {}), doc.get(CONTENT_VERSION_FIELD, 0)
+
+    async def read_version(self):
+        edu_collection = await get_educational_content_collection()
+        doc = await edu_collection.find_one(CONTENT_FILTER, {CONTENT_VERSION_FIELD: 1})
+        return doc.get(CONTENT_VERSION_FIELD, 0) if doc else None
+
+    async def watch_collection(self):
+        return await get_educational_content_collection()
+
+    @staticmethod
+    def _subject_path(path: tuple) -> str:
+        return "content." + ".".join(path)
+
+    @staticmethod
+    def _dig(doc, dotted: str):
+        for part in dotted.split("."):
+            if not isinstance(doc, dict) or part not in doc:
+                return None
+            doc = doc[part]
+        return doc
+
+    async def _create_document(self, edu_collection) -> bool:
+        """Creates the content document if there is none yet; True when the caller should retry its write."""
+        if await edu_collection.find_one(CONTENT_FILTER, {"_id": 1}):
+            return False
+        await edu_collection.update_one(
+            {"_id": CONTENT_DOCUMENT_ID},
+            {"$setOnInsert": {"content": {}, "created_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        return True
+
+    async def _read(self, edu_collection, dotted: str):
+        doc = await edu_collection.find_one(CONTENT_FILTER, {dotted: 1})
+        return self._dig(doc, dotted)
+
+    async def _max_id(self, edu_collection, dotted: str) -> int:
+        nodes = await self._read(edu_collection, dotted) or {}
+        return max((int(k) for k in nodes.keys() if str(k).isdigit()), default=0)
+
+    async def get_subject(self, path: tuple):
+        """Returns (subject node, created); a missing subject is added as an empty node."""
+        edu_collection = await get_educational_content_collection()
+        subject_path = self._subject_path(path)
+        subject = await self._read(edu_collection, subject_path)
+        created = False
+        if subject is None:
+            query = {**CONTENT_FILTER, subject_path: {"$exists": False}}
+            update = {"$set": {subject_path: {"chapters": {}, "lessons": {}}}, "$inc": {CONTENT_VERSION_FIELD: 1}}
+            result = await edu_collection.update_one(query, update)
+            if not result.matched_count and await self._create_document(edu_collection):
+                result = await edu_collection.update_one(query, update)
+            created = bool(result.matched_count)
+            subject = await self._read(edu_collection, subject_path)
+        return subject or {"chapters": {}, "lessons": {}}, created
+
+    async def _insert_node(self, path: tuple, kind: str, node: dict, extra_filter: dict = None):
+        """Stores node under the next id from the subject's counter; returns None when extra_filter didn't match."""
+        edu_collection = await get_educational_content_collection()
+        nodes_path = f"{self._subject_path(path)}.{kind}"
+        counter = _counter_name(kind, path)
+        # Checked before allocating, so a rejected node (e.g. an unknown chapter) doesn't use up an id
+        if extra_filter and not await edu_collection.find_one({**CONTENT_FILTER, **extra_filter}, {"_id": 1}):
+            return None
+        for _ in range(MAX_ID_ATTEMPTS):
+            new_id = await allocate_id(counter, lambda: self._max_id(edu_collection, nodes_path))
+            node_path = f"{nodes_path}.{new_id}"
+            result = await edu_collection.update_one(
+                {**CONTENT_FILTER, **(extra_filter or {}), node_path: {"$exists": False}},
+                {"$set": {node_path: node}, "$inc": {CONTENT_VERSION_FIELD: 1}}
+            )
+            if result.matched_count:
+                return new_id
+            # Still checked here: the target may have been deleted since
+            if extra_filter and not await edu_collection.find_one({**CONTENT_FILTER, **extra_filter}, {"_id": 1}):
+                return None
+            if await self._create_document(edu_collection):
+                continue
+            # The id is already taken (e.g. the tree was edited by hand); move the counter past it
+            await reseed_counter(counter, await self._max_id(edu_collection, nodes_path))
+        raise RuntimeError("Could not allocate a content id")
+
+    async def create_chapter(self, path: tuple, chapter: dict):
+        new_id = await self._insert_node(path, "chapters", chapter)
+        return new_id, chapter
+
+    async def update_chapter(self, path: tuple, chapter_id: int, fields: dict):
+        edu_collection = await get_educational_content_collection()
+        chapter_path = f"{self._subject_path(path)}.chapters.{chapter_id}"
+        update = {"$inc": {CONTENT_VERSION_FIELD: 1}}
+        if fields:
+            update["$set"] = {f"{chapter_path}.{k}": v for k, v in fields.items()}
+        doc = await edu_collection.find_one_and_update(
+            {**CONTENT_FILTER, chapter_path: {"$exists": True}},
+            update,
+            projection={chapter_path: 1},
+            return_document=ReturnDocument.AFTER
+        )
+        return self._dig(doc, chapter_path)
+
+    async def delete_chapter(self, path: tuple, chapter_id: int):
+        edu_collection = await get_educational_content_collection()
+        subject_path = self._subject_path(path)
+        chapter_path = f"{subject_path}.chapters.{chapter_id}"
+        # Remove all lessons that belong to this chapter as well
+        lessons = await self._read(edu_collection, f"{subject_path}.lessons") or {}
+        unset = {chapter_path: ""}
+        for lid, ldata in lessons.items():
+            if ldata.get("chapter_id") == chapter_id:
+                unset[f"{subject_path}.lessons.{lid}"] = ""
+        doc = await edu_collection.find_one_and_update(
+            {**CONTENT_FILTER, chapter_path: {"$exists": True}},
+            {"$unset": unset, "$inc": {CONTENT_VERSION_FIELD: 1}},
+            projection={chapter_path: 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        return self._dig(doc, chapter_path)
+
+    async def create_lesson(self, path: tuple, lesson: dict):
+        chapter_path = f"{self._subject_path(path)}.chapters.{lesson['chapter_id']}"
+        new_id = await self._insert_node(path, "lessons", lesson, {chapter_path: {"$exists": True}})
+        if new_id is None:
+            raise ChapterNotFound(lesson["chapter_id"])
+        return new_id, lesson
+
+    async def update_lesson(self, path: tuple, lesson_id: int, fields: dict):
+        edu_collection = await get_educational_content_collection()
+        subject_path = self._subject_path(path)
+        lesson_path = f"{subject_path}.lessons.{lesson_id}"
+        query = {**CONTENT_FILTER, lesson_path: {"$exists": True}}
+        if "chapter_id" in fields:
+            query[f"{subject_path}.chapters.{fields['chapter_id']}"] = {"$exists": True}
+        update = {"$inc": {CONTENT_VERSION_FIELD: 1}}
+        if fields:
+            update["$set"] = {f"{lesson_path}.{k}": v for k, v in fields.items()}
+        doc = await edu_collection.find_one_and_update(
+            query, update, projection={lesson_path: 1}, return_document=ReturnDocument.AFTER
+        )
+        if doc is None and "chapter_id" in fields and await self._read(edu_collection, lesson_path) is not None:
+            raise ChapterNotFound(fields["chapter_id"])
+        return self._dig(doc, lesson_path)
+
+    async def delete_lesson(self, path: tuple, lesson_id: int):
+        edu_collection = await get_educational_content_collection()
+        lesson_path = f"{self._subject_path(path)}.lessons.{lesson_id}"
+        doc = await edu_collection.find_one_and_update(
+            {**CONTENT_FILTER, lesson_path: {"$exists": True}},
+            {"$unset": {lesson_path: ""}, "$inc": {CONTENT_VERSION_FIELD: 1}},
+            projection={lesson_path: 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        return self._dig(doc, lesson_path)
+
+
+class CollectionsContentStore:
+    """Stores one document per chapter and per lesson, keyed by (year, term, language, subject, id)."""
+
+    name = "collections"
+    META_ID = "content"
+
+    async def ensure_indexes(self):
+        subject_key = [(field, ASCENDING) for field in SUBJECT_FIELDS]
+        chapters = await get_chapters_collection()
+        lessons = await get_lessons_collection()
+        await chapters.create_index(subject_key + [("id", ASCENDING)], unique=True)
+        await lessons.create_index(subject_key + [("id", ASCENDING)], unique=True)
+        await lessons.create_index(subject_key + [("chapter_id", ASCENDING)])
+
+    async def load(self):
+        chapters = await get_chapters_collection()
+        lessons = await get_lessons_collection()
+        content = {}
+        sort = [(field, ASCENDING) for field in SUBJECT_FIELDS] + [("id", ASCENDING)]
+        for collection, kind in ((chapters, "chapters"), (lessons, "lessons")):
+            async for node in collection.find({}, {"_id": 0}).sort(sort):
+                year, term, language, subject = (node.pop(field) for field in SUBJECT_FIELDS)
+                node_id = node.pop("id")
+                subject_node = (
+                    content.setdefault(year, {})
+                    .setdefault(term, {})
+                    .setdefault(language, {})
+                    .setdefault(subject, {"chapters": {}, "lessons": {}})
+                )
+                subject_node[kind][str(node_id)] = node
+        return content, await self.read_version()
+
+    async def read_version(self):
+        meta = await get_content_meta_collection()
+        doc = await meta.find_one({"_id": self.META_ID})
+        return doc.get("version", 0) if doc else 0
+
+    async def watch_collection(self):
+        # Every write bumps the meta document, so watching it is enough
+        return await get_content_meta_collection()
+
+    async def bump_version(self):
+        meta = await get_content_meta_collection()
+        await meta.update_one({"_id": self.META_ID}, {"$inc": {"version": 1}}, upsert=True)
+
+    async def _chapter_exists(self, path: tuple, chapter_id: int) -> bool:
+        chapters = await get_chapters_collection()
+        return await chapters.find_one({**_subject_filter(path), "id": int(chapter_id)}, {"_id": 1}) is not None
+
+    async def _max_id(self, collection, path: tuple) -> int:
+        last = await collection.find(_subject_filter(path), {"id": 1}).sort("id", DESCENDING).limit(1).to_list(1)
+        return last[0]["id"] if last else 0
+
+    async def _insert_with_next_id(self, collection, kind: str, path: tuple, node: dict) -> int:
+        key = _subject_filter(path)
+        counter = _counter_name(kind, path)
+        for _ in range(MAX_ID_ATTEMPTS):
+            new_id = await allocate_id(counter, lambda: self._max_id(collection, path))
+            try:
+                await collection.insert_one({**key, "id": new_id, **node})
+                return new_id
+            except DuplicateKeyError:
+                # The id is already taken (e.g. rows migrated after the counter was seeded)
+                await reseed_counter(counter, await self._max_id(collection, path))
+        raise RuntimeError("Could not allocate a content id")
+
+    async def get_subject(self, path: tuple):
+        """Returns (subject node, created); created is always False, an empty subject has no rows to write."""
+        key = _subject_filter(path)
+        chapters = await get_chapters_collection()
+        lessons = await get_lessons_collection()
+        node = {"chapters": {}, "lessons": {}}
+        for collection, kind in ((chapters, "chapters"), (lessons, "lessons")):
+            async for doc in collection.find(key, {"_id": 0, **{field: 0 for field in SUBJECT_FIELDS}}).sort("id", ASCENDING):
+                node[kind][str(doc.pop("id"))] = doc
+        return node, False
+
+    async def create_chapter(self, path: tuple, chapter: dict):
+        chapters = await get_chapters_collection()
+        new_id = await self._insert_with_next_id(chapters, "chapters", path, chapter)
+        await self.bump_version()
+        return new_id, chapter
+
+    async def update_chapter(self, path: tuple, chapter_id: int, fields: dict):
+        chapters = await get_chapters_collection()
+        chapter = await chapters.find_one_and_update(
+            {**_subject_filter(path), "id": chapter_id},
+            {"$set": fields},
+            projection=NODE_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+        if chapter is not None:
+            await self.bump_version()
+        return chapter
+
+    async def delete_chapter(self, path: tuple, chapter_id: int):
+        chapters = await get_chapters_collection()
+        lessons = await get_lessons_collection()
+        deleted = await chapters.find_one_and_delete(
+            {**_subject_filter(path), "id": chapter_id},
+            projection=NODE_PROJECTION
+        )
+        if deleted is None:
+            return None
+        await lessons.delete_many({**_subject_filter(path), "chapter_id": chapter_id})
+        await self.bump_version()
+        return deleted
+
+    async def create_lesson(self, path: tuple, lesson: dict):
+        if not await self._chapter_exists(path, lesson["chapter_id"]):
+            raise ChapterNotFound(lesson["chapter_id"])
+        lessons = await get_lessons_collection()
+        new_id = await self._insert_with_next_id(lessons, "lessons", path, lesson)
+        await self.bump_version()
+        return new_id, lesson
+
+    async def update_lesson(self, path: tuple, lesson_id: int, fields: dict):
+        if "chapter_id" in fields and not await self._chapter_exists(path, fields["chapter_id"]):
+            raise ChapterNotFound(fields["chapter_id"])
+        lessons = await get_lessons_collection()
+        lesson = await lessons.find_one_and_update(
+            {**_subject_filter(path), "id": lesson_id},
+            {"$set": fields},
+            projection=NODE_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+        if lesson is not None:
+            await self.bump_version()
+        return lesson
+
+    async def delete_lesson(self, path: tuple, lesson_id: int):
+        lessons = await get_lessons_collection()
+        deleted = await lessons.find_one_and_delete(
+            {**_subject_filter(path), "id": lesson_id},
+            projection=NODE_PROJECTION
+        )
+        if deleted is not None:
+            await self.bump_version()
+        return deleted
+
+
+content_store = CollectionsContentStore() if CONTENT_BACKEND == "collections" else DocumentContentStore()
@@ -0,0 +1,180 @@
+# dashboard.py
+# Admin dashboard numbers, from one $facet aggregation over receipts or, with
+# DASHBOARD_ROLLUPS=1, from the daily_rollups collection kept up to date as receipts
+# are written. Rebuild the rollups from receipts (e.g. before first enabling them):
+#
+#   python3 dashboard.py --rebuild-rollups
+import os
+import sys
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReplaceOne
+
+from caching import TTLCache
+from database import (
+    connect_to_mongo, close_mongo_connection, get_receipt_collection, get_student_collection,
+    get_books_collection, get_payments_collection, get_daily_rollups_collection,
+    PAYMENT_LIST_PROJECTION
+)
+
+DASHBOARD_ROLLUPS = os.environ.get("DASHBOARD_ROLLUPS", "0") == "1"
+DASHBOARD_CACHE_TTL_SECONDS = float(os.environ.get("DASHBOARD_CACHE_TTL_SECONDS", "15"))
+# Days shown in revenue_by_day and items shown in revenue_by_item
+DASHBOARD_DAYS = int(os.environ.get("DASHBOARD_DAYS", "30"))
+DASHBOARD_TOP_ITEMS = int(os.environ.get("DASHBOARD_TOP_ITEMS", "20"))
+
+# daily_rollups holds one {_id: "YYYY-MM-DD", receipts, revenue} document per day plus
+# {_id: "total", receipts, revenue, items: {"<receipt_type>:<item_id>": {receipts, revenue}}}
+TOTAL_ROLLUP_ID = "total"
+
+dashboard_cache = TTLCache(1, DASHBOARD_CACHE_TTL_SECONDS)
+
+# Summed as a double like the old float(amount) loop did: receipts written before amount was
+# always a float (strings, ints) still count, and unparseable or missing ones count as 0
+AMOUNT = {"$convert": {"input": "$amount", "to": "double", "onError": 0, "onNull": 0}}
+
+
+def _day(when: datetime) -> str:
+    return when.strftime("%Y-%m-%d")
+
+
+def _item_key(receipt_type, item_id) -> str:
+    # Stored as a field name, so keep it free of "." and a leading "$"
+    return f"{receipt_type}:{item_id}".replace(".", "_").lstrip("$")
+
+
+def _first_day() -> datetime:
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=DASHBOARD_DAYS - 1)
+
+
+async def record_receipt(receipt: dict):
+    """Adds one newly inserted receipt to the rollups (with DASHBOARD_ROLLUPS=1) and drops the cached dashboard."""
+    if not DASHBOARD_ROLLUPS:
+        dashboard_cache.clear()
+        return
+    amount = float(receipt.get("amount") or 0)
+    item = f"items.{_item_key(receipt.get('receipt_type'), receipt.get('item_id'))}"
+    rollups = await get_daily_rollups_collection()
+    try:
+        await rollups.update_one({"_id": _day(receipt["created_at"])}, {"$inc": {"receipts": 1, "revenue": amount}}, upsert=True)
+        await rollups.update_one(
+            {"_id": TOTAL_ROLLUP_ID},
+            {"$inc": {"receipts": 1, "revenue": amount, f"{item}.receipts": 1, f"{item}.revenue": amount}},
+            upsert=True
+        )
+    except Exception as e:
+        # The receipt itself is already stored; --rebuild-rollups repairs the totals
+        print(f"Failed to update daily_rollups: {e}")
+    dashboard_cache.clear()
+
+
+async def _receipt_stats_from_aggregate() -> dict:
+    receipts = await get_receipt_collection()
+    pipeline = [{"$facet": {
+        "totals": [{"$group": {"_id": None, "receipts": {"$sum": 1}, "revenue": {"$sum": AMOUNT}}}],
+        "by_day": [
+            {"$match": {"created_at": {"$gte": _first_day()}}},
+            {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}, "receipts": {"$sum": 1}, "revenue": {"$sum": AMOUNT}}},
+            {"$sort": {"_id": 1}},
+        ],
+        "by_item": [
+            {"$group": {"_id": {"receipt_type": "$receipt_type", "item_id": "$item_id"}, "receipts": {"$sum": 1}, "revenue": {"$sum": AMOUNT}}},
+            {"$sort": {"revenue": -1}},
+            {"$limit": DASHBOARD_TOP_ITEMS},
+        ],
+    }}]
+    result = (await receipts.aggregate(pipeline).to_list(1))[0]
+    totals = result["totals"][0] if result["totals"] else {"receipts": 0, "revenue": 0.0}
+    return {
+        "total_receipts": totals["receipts"],
+        "total_revenue": totals["revenue"],
+        "revenue_by_day": [{"day": d["_id"], "receipts": d["receipts"], "revenue": d["revenue"]} for d in result["by_day"]],
+        "revenue_by_item": [{**i["_id"], "receipts": i["receipts"], "revenue": i["revenue"]} for i in result["by_item"]],
+    }
+
+
+async def _receipt_stats_from_rollups() -> dict:
+    rollups = await get_daily_rollups_collection()
+    total = await rollups.find_one({"_id": TOTAL_ROLLUP_ID}) or {}
+    days = await rollups.find({"_id": {"$gte": _day(_first_day()), "$ne": TOTAL_ROLLUP_ID}}).sort("_id", 1).to_list(DASHBOARD_DAYS)
+    items = []
+    for key, stats in (total.get("items") or {}).items():
+        receipt_type, _, item_id = key.partition(":")
+        items.append({"receipt_type": receipt_type, "item_id": item_id, "receipts": stats.get("receipts", 0), "revenue": stats.get("revenue", 0.0)})
+    items.sort(key=lambda i: i["revenue"], reverse=True)
+    return {
+        "total_receipts": total.get("receipts", 0),
+        "total_revenue": total.get("revenue", 0.0),
+        "revenue_by_day": [{"day": d["_id"], "receipts": d.get("receipts", 0), "revenue": d.get("revenue", 0.0)} for d in days],
+        "revenue_by_item": items[:DASHBOARD_TOP_ITEMS],
+    }
+
+
+async def _recent_payments() -> list:
+    payments = await get_payments_collection()
+    docs = await payments.find({}, PAYMENT_LIST_PROJECTION).sort([("created_at", -1), ("_id", -1)]).limit(10).to_list(10)
+    for doc in docs:
+        doc["_id"] = str(doc["_id"])
+    return docs
+
+
+async def build_dashboard() -> dict:
+    cached = dashboard_cache.get("dashboard")
+    if cached is not None:
+        return cached
+    students, books = await get_student_collection(), await get_books_collection()
+    receipt_stats, total_students, total_books, recent_payments = await asyncio.gather(
+        _receipt_stats_from_rollups() if DASHBOARD_ROLLUPS else _receipt_stats_from_aggregate(),
+        # Collection metadata counts: constant time, exact outside of unclean shutdowns
+        students.estimated_document_count(),
+        books.estimated_document_count(),
+        _recent_payments(),
+    )
+    dashboard = {
+        "total_students": total_students,
+        "total_books": total_books,
+        **receipt_stats,
+        "recent_payments": recent_payments,
+        "source": "rollups" if DASHBOARD_ROLLUPS else "aggregate",
+        "generated_at": datetime.now(timezone.utc),
+    }
+    dashboard_cache.set("dashboard", dashboard)
+    return dashboard
+
+
+async def rebuild_rollups():
+    receipts = await get_receipt_collection()
+    rollups = await get_daily_rollups_collection()
+    by_day = await receipts.aggregate([
+        {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}, "receipts": {"$sum": 1}, "revenue": {"$sum": AMOUNT}}},
+    ]).to_list(None)
+    by_item = await receipts.aggregate([
+        {"$group": {"_id": {"receipt_type": "$receipt_type", "item_id": "$item_id"}, "receipts": {"$sum": 1}, "revenue": {"$sum": AMOUNT}}},
+    ]).to_list(None)
+    total = {
+        "_id": TOTAL_ROLLUP_ID,
+        "receipts": sum(d["receipts"] for d in by_day),
+        "revenue": sum(d["revenue"] for d in by_day),
+        "items": {_item_key(i["_id"].get("receipt_type"), i["_id"].get("item_id")): {"receipts": i["receipts"], "revenue": i["revenue"]} for i in by_item},
+    }
+    docs = [d for d in by_day if d["_id"]] + [total]
+    await rollups.delete_many({"_id": {"$nin": [d["_id"] for d in docs]}})
+    await rollups.bulk_write([ReplaceOne({"_id": d["_id"]}, d, upsert=True) for d in docs], ordered=False)
+    print(f"Rebuilt daily_rollups: {len(by_day)} days, {total['receipts']} receipts, revenue {total['revenue']}.")
+
+
+async def main():
+    if "--rebuild-rollups" not in sys.argv[1:]:
+        print("usage: python3 dashboard.py --rebuild-rollups")
+        sys.exit(2)
+    await connect_to_mongo()
+    try:
+        await rebuild_rollups()
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
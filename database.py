@@ -1,21 +1,138 @@
 # database.py
 import os
+import asyncio
 import motor.motor_asyncio
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
 from dotenv import load_dotenv
 import sys
 
+from mongo_metrics import mongo_metrics
+from log_sink import audit_sink
+
 load_dotenv()
 
 MONGO_URI = os.environ.get("MONGODB_URI")
+# "document" keeps the whole catalog in one educational_content document,
+# "collections" stores it as one document per chapter / lesson (see migrate_content.py)
+CONTENT_BACKEND = os.environ.get("CONTENT_BACKEND", "document")
+
+# Connection pool, per uvicorn worker. Unset values keep the driver defaults.
+MONGO_POOL_SETTINGS = {
+    "maxPoolSize": os.environ.get("MONGO_MAX_POOL_SIZE"),
+    "minPoolSize": os.environ.get("MONGO_MIN_POOL_SIZE"),
+    "maxIdleTimeMS": os.environ.get("MONGO_MAX_IDLE_TIME_MS"),
+    "waitQueueTimeoutMS": os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS"),
+}
+# How long startup waits for the pool to reach minPoolSize before serving anyway
+MONGO_POOL_WARM_UP_SECONDS = float(os.environ.get("MONGO_POOL_WARM_UP_SECONDS", "5"))
+# Comma-separated wire compressors, e.g. "zstd,zlib" (zstd needs the zstandard package)
+MONGO_COMPRESSORS = os.environ.get("MONGO_COMPRESSORS")
+
+def client_options() -> dict:
+    options = {name: int(value) for name, value in MONGO_POOL_SETTINGS.items() if value}
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    options["event_listeners"] = [mongo_metrics]
+    return options
+
+# Every index the app relies on, created once by connect_to_mongo: (collection, keys, options)
+INDEXES = [
+    ("students", [("phone", ASCENDING)], {}),
+    ("students", [("email", ASCENDING)], {}),
+    ("students", [("student_code", ASCENDING)], {}),
+    ("sessions", [("token_hash", ASCENDING)], {"unique": True}),
+    ("sessions", [("student_id", ASCENDING)], {}),
+    ("sessions", [("expire_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    ("token_blacklist", [("expire_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    ("token_blacklist", [("token_hash", ASCENDING)], {}),
+    # Incremental blacklist syncs read entries by created_at
+    ("token_blacklist", [("created_at", ASCENDING)], {}),
+    # Deletes reset codes once they expire (10 minutes)
+    ("password_reset_codes", [("expire_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    ("receipts", [("student_code", ASCENDING), ("receipt_type", ASCENDING), ("created_at", ASCENDING)], {}),
+    # Newest-first keyset pagination sorts on (created_at, _id)
+    ("receipts", [("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+    # At most one receipt per Paymob order; manual and buy-item receipts have no merchant_order_id
+    ("receipts", [("merchant_order_id", ASCENDING)], {"unique": True, "partialFilterExpression": {"merchant_order_id": {"$exists": True}}}),
+    ("favorite_videos", [("student_id", ASCENDING), ("video_id", ASCENDING)], {}),
+    ("mock_test_results", [("student_code", ASCENDING), ("id", ASCENDING)], {}),
+    ("mock_videos", [("id", ASCENDING)], {}),
+    ("books", [("id", ASCENDING)], {}),
+    ("payments", [("student_code", ASCENDING)], {}),
+    ("payments", [("student_id", ASCENDING)], {}),
+    ("payments", [("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+    ("payments", [("status", ASCENDING)], {}),
+    # Sparse: pending payments don't have a Paymob order id yet
+    ("payments", [("paymob_order_id", ASCENDING)], {"unique": True, "sparse": True}),
+    ("payments", [("merchant_order_id", ASCENDING)], {"unique": True}),
+]
+
+# Indexes already deployed with other options than INDEXES asks for now. create_index can't
+# change an existing index (it fails with IndexOptionsConflict), so ensure_indexes drops these
+# and builds them again. paymob_order_id_1 used to be unique without sparse.
+REBUILT_INDEXES = {("payments", "paymob_order_id_1")}
+INDEX_NOT_FOUND = 27
+
+# Fields list and export endpoints never send back
+STUDENT_LIST_PROJECTION = {"password": 0, "active_refresh_tokens": 0}
+TEACHER_LIST_PROJECTION = {"password": 0}
+PAYMENT_LIST_PROJECTION = {"webhook_payload": 0}
 
 class DataBase:
     client: motor.motor_asyncio.AsyncIOMotorClient = None
+    collections: dict = {}
 
 db = DataBase()
 
-async def get_database() -> motor.motor_asyncio.AsyncIOMotorDatabase:
+def get_database() -> motor.motor_asyncio.AsyncIOMotorDatabase:
     return db.client.easybio_db
 
+def get_collection(name: str) -> motor.motor_asyncio.AsyncIOMotorCollection:
+    collection = db.collections.get(name)
+    if collection is None:
+        collection = db.collections[name] = get_database().get_collection(name)
+    return collection
+
+def _index_name(keys) -> str:
+    # The name create_index gives an index when none is passed
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+async def _drop_if_options_changed(collection, index_name: str, options: dict):
+    existing = (await collection.index_information()).get(index_name)
+    if existing is None or all(existing.get(k) == v for k, v in options.items()):
+        return
+    print(f"Rebuilding index {index_name} on {collection.name} with {options}")
+    try:
+        await collection.drop_index(index_name)
+    except OperationFailure as e:
+        # Another worker starting up at the same time may have dropped it first
+        if e.code != INDEX_NOT_FOUND:
+            raise
+
+async def ensure_indexes():
+    """Creates the INDEXES that are missing. A failing index is logged and skipped."""
+    for name, keys, options in INDEXES:
+        try:
+            if (name, _index_name(keys)) in REBUILT_INDEXES:
+                await _drop_if_options_changed(get_collection(name), _index_name(keys), options)
+            await get_collection(name).create_index(keys, **options)
+        except Exception as e:
+            print(f"WARNING: could not create index {keys} on {name}: {e}")
+
+async def warm_up_pool():
+    """Waits for minPoolSize connections to be open, so the first requests don't pay for them.
+
+    pymongo's background maintenance opens them (it tops the pool up about once a second);
+    this only waits, for at most MONGO_POOL_WARM_UP_SECONDS. Firing pings instead doesn't
+    work: each returns its connection before the next checks one out, so they share one or two.
+    """
+    count = int(MONGO_POOL_SETTINGS["minPoolSize"] or 0)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + MONGO_POOL_WARM_UP_SECONDS
+    while mongo_metrics.connections_open < count and loop.time() < deadline:
+        await asyncio.sleep(0.05)
+
 async def connect_to_mongo():
     print("Attempting to connect to MongoDB...")
     if not MONGO_URI:
@@ -23,9 +140,12 @@ async def connect_to_mongo():
         sys.exit(1)
     
     try:
-        db.client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
+        db.client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI, **client_options())
+        db.collections = {}
         await db.client.admin.command('ping')
-        print("MongoDB connection successful.")
+        await ensure_indexes()
+        await warm_up_pool()
+        print(f"MongoDB connection successful ({mongo_metrics.connections_open} pooled connections).")
     except Exception as e:
         print("------------------------------------------------------")
         print("FATAL ERROR: Could not connect to MongoDB.")
@@ -35,88 +155,80 @@ async def connect_to_mongo():
 
 async def close_mongo_connection():
     if db.client:
+        # Write out buffered audit events while the client is still open
+        await audit_sink.close()
         print("Closing MongoDB connection...")
         db.client.close()
+        db.collections = {}
         print("Connection closed.")
 
 async def get_student_collection():
-    database = await get_database()
-    return database.get_collection("students")
+    return get_collection("students")
+
+# One document per refresh token: {token_hash, student_id, created_at, expire_at}
+async def get_sessions_collection():
+    return get_collection("sessions")
 
+# Revoked refresh tokens ({token_hash, expire_at}); see blacklist.py
 async def get_token_blacklist_collection():
-    database = await get_database()
-    collection = database.get_collection("token_blacklist")
-    index_name = "expire_at_1"
-    if index_name not in await collection.index_information():
-        await collection.create_index("expire_at", expireAfterSeconds=0)
-    return collection
+    return get_collection("token_blacklist")
 
 async def get_receipt_collection():
-    database = await get_database()
-    return database.get_collection("receipts")
+    return get_collection("receipts")
 
 # NEW: Collection for password reset codes
 async def get_password_reset_collection():
-    database = await get_database()
-    collection = database.get_collection("password_reset_codes")
-    # This TTL index automatically deletes codes after 10 minutes
-    index_name = "expire_at_1"
-    if index_name not in await collection.index_information():
-        await collection.create_index("expire_at", expireAfterSeconds=0)
-    return collection
+    return get_collection("password_reset_codes")
 
 async def get_favorite_videos_collection():
-    database = await get_database()
-    return database.get_collection("favorite_videos")
+    return get_collection("favorite_videos")
 
 # NEW: Functions to get collections for mock data
 async def get_educational_content_collection():
-    database = await get_database()
-    return database.get_collection("educational_content")
+    return get_collection("educational_content")
+
+async def get_chapters_collection():
+    return get_collection("chapters")
+
+async def get_lessons_collection():
+    return get_collection("lessons")
+
+async def get_content_meta_collection():
+    return get_collection("content_meta")
+
+# Atomic id sequences ({"_id": <name>, "seq": <last id>})
+async def get_counters_collection():
+    return get_collection("counters")
 
 async def get_books_collection():
-    database = await get_database()
-    return database.get_collection("books")
+    return get_collection("books")
 
 async def get_mock_test_results_collection():
-    database = await get_database()
-    return database.get_collection("mock_test_results")
+    return get_collection("mock_test_results")
 
 async def get_mock_videos_collection():
-    database = await get_database()
-    return database.get_collection("mock_videos")
+    return get_collection("mock_videos")
 
 # NEW: Admins collection
 async def get_admins_collection():
-    database = await get_database()
-    return database.get_collection("admins")
+    return get_collection("admins")
 
 # NEW: Teachers collection
 async def get_teachers_collection():
-    database = await get_database()
-    return database.get_collection("teachers")
+    return get_collection("teachers")
 
 # NEW: Payments collection
 async def get_payments_collection():
-    database = await get_database()
-    collection = database.get_collection("payments")
-    # Indexes for faster lookups
-    try:
-        existing_indexes = await collection.index_information()
-        if "student_code_1" not in existing_indexes:
-            await collection.create_index("student_code")
-        if "status_1" not in existing_indexes:
-            await collection.create_index("status")
-        if "paymob_order_id_1" not in existing_indexes:
-            await collection.create_index("paymob_order_id", unique=True)
-        if "merchant_order_id_1" not in existing_indexes:
-            await collection.create_index("merchant_order_id", unique=True)
-    except Exception:
-        # In some environments index creation may fail silently; continue
-        pass
-    return collection
+    return get_collection("payments")
+
+# Purchased chapter ids per student ({_id: student_code, chapter_ids}); see entitlements.py
+async def get_entitlements_collection():
+    return get_collection("entitlements")
+
+# Receipt counts and revenue per day, plus an all-time "total" document (see dashboard.py)
+async def get_daily_rollups_collection():
+    return get_collection("daily_rollups")
 
 # NEW: Paymob logs collection (optional)
 async def get_paymob_logs_collection():
-    database = await get_database()
-    return database.get_collection("paymob_logs")
\ No newline at end of file
+    return get_collection("paymob_logs")
\ No newline at end of file
@@ -0,0 +1,71 @@
+# entitlements.py
+# Chapters each student has bought, materialized as one document per student:
+#   {_id: <student_code>, chapter_ids: [int, ...], complete: bool, updated_at}
+# "complete" means chapter_ids already includes every receipt written before the
+# document existed; until then the first read backfills it from receipts.
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument
+
+from database import get_entitlements_collection, get_receipt_collection
+
+PURCHASE_RECEIPT_TYPE = "package_purchase"
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+async def grant_from_receipt(receipt: dict):
+    """Adds the chapter bought by a newly written receipt to the student's entitlements."""
+    if receipt.get("receipt_type") != PURCHASE_RECEIPT_TYPE or not receipt.get("student_code"):
+        return
+    chapter_id = _as_int(receipt.get("item_id"))
+    if chapter_id is None:
+        return
+    entitlements = await get_entitlements_collection()
+    try:
+        await entitlements.update_one(
+            {"_id": receipt["student_code"]},
+            {"$addToSet": {"chapter_ids": chapter_id}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+    except Exception as e:
+        print(f"Failed to update entitlements for {receipt['student_code']}: {e}")
+        try:
+            # Make the next read rebuild the set from receipts instead of trusting it
+            await entitlements.update_one({"_id": receipt["student_code"]}, {"$set": {"complete": False}})
+        except Exception:
+            pass
+
+
+async def _backfill(student_code: str) -> set:
+    receipts = await get_receipt_collection()
+    chapter_ids = set()
+    async for receipt in receipts.find({"student_code": student_code, "receipt_type": PURCHASE_RECEIPT_TYPE}, {"item_id": 1}):
+        chapter_id = _as_int(receipt.get("item_id"))
+        if chapter_id is not None:
+            chapter_ids.add(chapter_id)
+    entitlements = await get_entitlements_collection()
+    doc = await entitlements.find_one_and_update(
+        {"_id": student_code},
+        {
+            "$addToSet": {"chapter_ids": {"$each": sorted(chapter_ids)}},
+            "$set": {"complete": True, "updated_at": datetime.now(timezone.utc)}
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return set(doc.get("chapter_ids", []))
+
+
+async def purchased_chapter_ids(student_code: str) -> set:
+    """Chapter ids the student owns: one _id read once the entitlements document is complete."""
+    entitlements = await get_entitlements_collection()
+    doc = await entitlements.find_one({"_id": student_code}, {"chapter_ids": 1, "complete": 1})
+    if doc and doc.get("complete"):
+        return set(doc.get("chapter_ids", []))
+    return await _backfill(student_code)
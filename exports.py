@@ -0,0 +1,90 @@
+# exports.py
+import io
+import os
+import csv
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from database import STUDENT_LIST_PROJECTION, PAYMENT_LIST_PROJECTION
+
+# Documents pulled from Mongo (and rows written to the client) per round trip
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "500"))
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+class ExportSpec:
+    def __init__(self, columns: list, projection: dict = None, date_field: str = "created_at"):
+        self.columns = columns
+        self.projection = projection
+        # "_id" filters on the ObjectId's creation time, for collections without a timestamp
+        self.date_field = date_field
+
+
+EXPORTS = {
+    "students": ExportSpec(
+        ["_id", "student_code", "name", "phone", "email", "parent_phone", "city", "grade", "lang"],
+        STUDENT_LIST_PROJECTION,
+        date_field="_id",
+    ),
+    "receipts": ExportSpec(
+        ["_id", "student_id", "student_code", "receipt_type", "item_id", "amount", "description", "created_at"],
+    ),
+    "payments": ExportSpec(
+        ["_id", "merchant_order_id", "paymob_order_id", "student_id", "student_code", "item_type", "item_id",
+         "amount", "status", "payment_method", "created_at"],
+        PAYMENT_LIST_PROJECTION,
+    ),
+}
+
+
+def build_query(spec: ExportSpec, start: datetime = None, end: datetime = None, student_code: str = None) -> dict:
+    query = {}
+    if student_code:
+        query["student_code"] = student_code
+    date_range = {}
+    if start:
+        date_range["$gte"] = ObjectId.from_datetime(start) if spec.date_field == "_id" else start
+    if end:
+        date_range["$lt"] = ObjectId.from_datetime(end) if spec.date_field == "_id" else end
+    if date_range:
+        query[spec.date_field] = date_range
+    return query
+
+
+def _plain(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _ndjson_batch(docs: list) -> str:
+    return "".join(json.dumps(doc, default=_plain, ensure_ascii=False) + "\n" for doc in docs)
+
+
+def _csv_batch(docs: list, columns: list) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for doc in docs:
+        writer.writerow(["" if doc.get(c) is None else _plain(doc.get(c)) for c in columns])
+    return buffer.getvalue()
+
+
+async def stream_export(collection: AsyncIOMotorCollection, spec: ExportSpec, query: dict, fmt: str):
+    """Yields the export in EXPORT_BATCH_SIZE chunks; only one batch is held in memory."""
+    if fmt == "csv":
+        yield _csv_batch([{c: c for c in spec.columns}], spec.columns)
+    cursor = collection.find(query, spec.projection).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield _csv_batch(batch, spec.columns) if fmt == "csv" else _ndjson_batch(batch)
+            batch = []
+    if batch:
+        yield _csv_batch(batch, spec.columns) if fmt == "csv" else _ndjson_batch(batch)
@@ -0,0 +1,85 @@
+# http_cache.py
+import os
+
+from fastapi import Request, Response
+
+from compression import compressor
+from pagination import NEXT_CURSOR_HEADER
+
+# Cache-Control for the public catalog routes. Browsers revalidate after max-age; a CDN
+# keeps its copy for s-maxage and may serve it for stale-while-revalidate longer while it
+# refetches in the background. ETag revalidation makes every refetch a cheap 304.
+CATALOG_MAX_AGE_SECONDS = int(os.environ.get("CATALOG_MAX_AGE_SECONDS", "60"))
+CATALOG_SHARED_MAX_AGE_SECONDS = int(os.environ.get("CATALOG_SHARED_MAX_AGE_SECONDS", "300"))
+CATALOG_STALE_WHILE_REVALIDATE_SECONDS = int(os.environ.get("CATALOG_STALE_WHILE_REVALIDATE_SECONDS", "600"))
+
+CATALOG_CACHE_CONTROL = (
+    f"public, max-age={CATALOG_MAX_AGE_SECONDS}, s-maxage={CATALOG_SHARED_MAX_AGE_SECONDS}, "
+    f"stale-while-revalidate={CATALOG_STALE_WHILE_REVALIDATE_SECONDS}"
+)
+
+
+def encoded_etag(etag: str, coding: str) -> str:
+    # Each content-coding is its own representation, so it gets its own strong ETag
+    return etag if coding is None else f'{etag[:-1]}-{coding}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match uses weak comparison: W/"x" matches "x".
+
+    A tag of any encoding of the same body matches too, so a client that switches
+    between gzip and brotli still revalidates instead of refetching.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip().removeprefix("W/")
+        if tag == etag or any(tag == encoded_etag(etag, coding) for coding in compressor.encodings):
+            return True
+    return False
+
+
+class CatalogResponder:
+    """Turns a RenderedPayload into a 200, or a 304 when the client already has it."""
+
+    def __init__(self, cache_control: str = CATALOG_CACHE_CONTROL):
+        self.cache_control = cache_control
+        self.full = 0
+        self.not_modified = 0
+
+    def respond(self, request: Request, payload) -> Response:
+        coding = compressor.choose(request.headers.get("accept-encoding"))
+        if len(payload.body) < compressor.min_bytes:
+            coding = None
+        headers = {
+            "ETag": encoded_etag(payload.etag, coding),
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if getattr(payload, "next_cursor", None):
+            headers[NEXT_CURSOR_HEADER] = payload.next_cursor
+        if etag_matches(request.headers.get("if-none-match"), payload.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        self.full += 1
+        if coding is None:
+            return Response(content=payload.body, media_type="application/json", headers=headers)
+        # Compressed once per payload (i.e. per content version), not per request
+        body = payload.encoded(coding)
+        compressor.count(coding, len(payload.body), len(body))
+        headers["Content-Encoding"] = coding
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def stats(self) -> dict:
+        total = self.full + self.not_modified
+        return {
+            "cache_control": self.cache_control,
+            "full": self.full,
+            "not_modified": self.not_modified,
+            "not_modified_rate": round(self.not_modified / total, 4) if total else None,
+        }
+
+
+catalog_responder = CatalogResponder()
@@ -0,0 +1,41 @@
+# json_response.py
+import orjson
+from bson import ObjectId, Decimal128
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+# Routes with a response_model don't need this: FastAPI serializes them with the model's
+# compiled pydantic serializer (TypeAdapter.dump_json) as long as no response_class is set
+# on the route or the app. This is for routes that hand back Mongo documents as they are.
+
+
+def _default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return float(obj.to_decimal())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    # datetime, date and UUID are native to orjson, in the same ISO format jsonable_encoder used
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MongoJSONResponse(JSONResponse):
+    """JSONResponse rendered by orjson, with ObjectId/Decimal128 handled natively."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def mongo_json(content, response: Response = None, status_code: int = 200) -> MongoJSONResponse:
+    """Returns `content` as a MongoJSONResponse, skipping FastAPI's jsonable_encoder pass.
+
+    Headers set on the route's injected `response` (e.g. the next-page cursor) are carried
+    over, since FastAPI only merges them into responses it builds itself.
+    """
+    result = MongoJSONResponse(content, status_code=status_code)
+    if response is not None:
+        result.headers.raw.extend(response.headers.raw)
+    return result
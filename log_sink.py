@@ -0,0 +1,125 @@
+# log_sink.py
+import os
+import asyncio
+from collections import defaultdict
+
+from pymongo.errors import BulkWriteError
+
+# Events buffered in memory; past this, new events are dropped rather than slowing requests
+LOG_SINK_MAX_QUEUE = int(os.environ.get("LOG_SINK_MAX_QUEUE", "10000"))
+LOG_SINK_BATCH_SIZE = int(os.environ.get("LOG_SINK_BATCH_SIZE", "500"))
+LOG_SINK_FLUSH_SECONDS = float(os.environ.get("LOG_SINK_FLUSH_SECONDS", "1.0"))
+
+_STOP = object()
+
+
+class AuditLogSink:
+    """Append-only audit documents written in the background with batched insert_many.
+
+    emit() never waits on Mongo: events go into a bounded queue and a single task
+    flushes them every LOG_SINK_BATCH_SIZE events or LOG_SINK_FLUSH_SECONDS, whichever
+    comes first. When Mongo falls behind and the queue fills up, events are dropped and
+    counted instead of blocking the request that emitted them.
+    """
+
+    def __init__(self, max_queue: int = LOG_SINK_MAX_QUEUE, batch_size: int = LOG_SINK_BATCH_SIZE,
+                 flush_seconds: float = LOG_SINK_FLUSH_SECONDS):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue = None
+        self._task = None
+        self._get_collection = None
+        self._closing = False
+        self.emitted = 0
+        self.written = 0
+        self.batches = 0
+        self.dropped = defaultdict(int)      # collection -> events dropped on a full queue
+        self.write_errors = defaultdict(int) # collection -> events Mongo didn't accept
+
+    def start(self, get_collection):
+        """`get_collection(name)` returns the Motor collection to write a batch to."""
+        if self._task is not None:
+            return
+        self._get_collection = get_collection
+        self._closing = False
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    def emit(self, collection: str, doc: dict):
+        if self._queue is None or self._closing:
+            self.dropped[collection] += 1
+            return
+        try:
+            self._queue.put_nowait((collection, doc))
+            self.emitted += 1
+        except asyncio.QueueFull:
+            self.dropped[collection] += 1
+
+    async def _next_batch(self):
+        """Returns (batch, stop): up to batch_size events, or fewer once flush_seconds pass."""
+        first = await self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = asyncio.get_running_loop().time() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _write(self, batch: list):
+        by_collection = defaultdict(list)
+        for collection, doc in batch:
+            by_collection[collection].append(doc)
+        for collection, docs in by_collection.items():
+            try:
+                result = await self._get_collection(collection).insert_many(docs, ordered=False)
+                self.written += len(result.inserted_ids)
+            except Exception as e:
+                # ordered=False: whatever Mongo accepted is stored, the rest is counted as lost
+                inserted = e.details.get("nInserted", 0) if isinstance(e, BulkWriteError) else 0
+                self.written += inserted
+                self.write_errors[collection] += len(docs) - inserted
+                print(f"Audit log write to {collection} failed: {e}")
+        self.batches += 1
+
+    async def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = await self._next_batch()
+            if batch:
+                await self._write(batch)
+
+    async def close(self):
+        """Stops accepting events, then waits until everything already queued is written."""
+        if self._task is None:
+            return
+        self._closing = True
+        # Queued behind every pending event, so the flush task drains them all before stopping
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        self._queue = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "emitted": self.emitted,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": dict(self.dropped),
+            "write_errors": dict(self.write_errors),
+        }
+
+
+audit_sink = AuditLogSink()
@@ -0,0 +1,191 @@
+# mailer.py
+import os
+import time
+import asyncio
+from email.mime.text import MIMEText
+
+import aiosmtplib
+
+SMTP_HOST = os.environ.get("SMTP_HOST", "smtp.hostinger.com")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
+SMTP_USERNAME = os.environ.get("SMTP_USERNAME", "noreply@easybio-drabdelrahman.com")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD", "Webacc@123")
+MAIL_FROM = os.environ.get("MAIL_FROM", SMTP_USERNAME)
+# "auto" upgrades with STARTTLS whenever the server offers it
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "auto")
+# SMTP sessions kept open (one per sender task)
+MAIL_CONNECTIONS = int(os.environ.get("MAIL_CONNECTIONS", "2"))
+MAIL_QUEUE_SIZE = int(os.environ.get("MAIL_QUEUE_SIZE", "1000"))
+MAIL_MAX_ATTEMPTS = int(os.environ.get("MAIL_MAX_ATTEMPTS", "4"))
+# The k-th retry of a mail waits MAIL_RETRY_BACKOFF_SECONDS * 2 ** (k - 1)
+MAIL_RETRY_BACKOFF_SECONDS = float(os.environ.get("MAIL_RETRY_BACKOFF_SECONDS", "2"))
+# Sessions idle longer than this are re-opened instead of reused (servers drop idle clients)
+MAIL_IDLE_SECONDS = float(os.environ.get("MAIL_IDLE_SECONDS", "60"))
+MAIL_DRAIN_SECONDS = float(os.environ.get("MAIL_DRAIN_SECONDS", "10"))
+
+
+class _Session:
+    """One reusable SMTP connection: connect + STARTTLS + AUTH happen once, not per mail."""
+
+    def __init__(self, mailer: "Mailer"):
+        self.mailer = mailer
+        self.smtp = None
+        self.last_used = 0.0
+
+    async def _open(self):
+        m = self.mailer
+        start_tls = None if m.start_tls == "auto" else m.start_tls == "1"
+        self.smtp = aiosmtplib.SMTP(
+            hostname=m.host, port=m.port, username=m.username or None, password=m.password or None,
+            start_tls=start_tls, timeout=m.timeout
+        )
+        await self.smtp.connect()
+        m.connections_opened += 1
+
+    async def close(self):
+        if self.smtp is not None:
+            try:
+                await self.smtp.quit()
+            except Exception:
+                self.smtp.close()
+            self.smtp = None
+
+    async def send(self, message):
+        stale = time.monotonic() - self.last_used > self.mailer.idle_seconds
+        if self.smtp is None or not self.smtp.is_connected or stale:
+            await self.close()
+            await self._open()
+        try:
+            await self.smtp.send_message(message)
+        except aiosmtplib.SMTPServerDisconnected:
+            # Dropped between mails; one reconnect doesn't count as a failed attempt
+            await self.close()
+            await self._open()
+            await self.smtp.send_message(message)
+        self.last_used = time.monotonic()
+
+
+class MailerBusy(Exception):
+    """Raised when the outbound queue is full."""
+
+
+class Mailer:
+    """Async outbound mail: a bounded queue drained by MAIL_CONNECTIONS persistent SMTP sessions."""
+
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, username: str = SMTP_USERNAME,
+                 password: str = SMTP_PASSWORD, sender: str = MAIL_FROM, start_tls: str = SMTP_STARTTLS,
+                 connections: int = MAIL_CONNECTIONS, queue_size: int = MAIL_QUEUE_SIZE,
+                 max_attempts: int = MAIL_MAX_ATTEMPTS, backoff: float = MAIL_RETRY_BACKOFF_SECONDS,
+                 idle_seconds: float = MAIL_IDLE_SECONDS, timeout: float = 30):
+        self.host, self.port = host, port
+        self.username, self.password = username, password
+        self.sender = sender
+        self.start_tls = start_tls
+        self.connections = connections
+        self.queue_size = queue_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.idle_seconds = idle_seconds
+        self.timeout = timeout
+        self._queue = None
+        self._workers = []
+        self._sessions = []
+        self._retries = set()
+        self.started_at = None
+        self.accepted = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+        self.connections_opened = 0
+        self.send_seconds = 0.0
+
+    def start(self):
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._sessions = [_Session(self) for _ in range(self.connections)]
+        self._workers = [asyncio.create_task(self._run(session)) for session in self._sessions]
+        self.started_at = time.monotonic()
+
+    def _enqueue(self, message, attempt: int) -> bool:
+        try:
+            self._queue.put_nowait((message, attempt))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    def send(self, to: str, subject: str, body: str, sender: str = None):
+        """Queues a plain-text mail and returns immediately; raises MailerBusy when full."""
+        self.start()
+        message = MIMEText(body)
+        message["Subject"], message["From"], message["To"] = subject, sender or self.sender, to
+        if not self._enqueue(message, 1):
+            raise MailerBusy()
+        self.accepted += 1
+
+    def send_password_reset(self, email: str, code: str):
+        self.send(email, "Your Password Reset Code", f"Your password reset code is: {code}\nIt is valid for 10 minutes.")
+
+    async def _retry_later(self, message, attempt: int):
+        await asyncio.sleep(self.backoff * 2 ** (attempt - 2))
+        self._enqueue(message, attempt)
+
+    async def _run(self, session: _Session):
+        while True:
+            message, attempt = await self._queue.get()
+            started = time.perf_counter()
+            try:
+                await session.send(message)
+                self.sent += 1
+                self.send_seconds += time.perf_counter() - started
+            except Exception as e:
+                await session.close()
+                if attempt < self.max_attempts:
+                    self.retried += 1
+                    retry = asyncio.create_task(self._retry_later(message, attempt + 1))
+                    self._retries.add(retry)
+                    retry.add_done_callback(self._retries.discard)
+                else:
+                    self.failed += 1
+                    print(f"Failed to send email to {message['To']} after {attempt} attempts. Error: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def close(self, drain_seconds: float = MAIL_DRAIN_SECONDS):
+        """Gives queued mail up to drain_seconds to go out, then closes every session."""
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), drain_seconds)
+        except asyncio.TimeoutError:
+            print(f"Mailer closing with {self._queue.qsize()} unsent emails.")
+        if self._retries:
+            print(f"Mailer closing with {len(self._retries)} emails waiting to be retried.")
+            self.failed += len(self._retries)
+        for task in [*self._retries, *self._workers]:
+            task.cancel()
+        await asyncio.gather(*self._retries, *self._workers, return_exceptions=True)
+        for session in self._sessions:
+            await session.close()
+        self._workers, self._sessions, self._queue = [], [], None
+
+    def stats(self) -> dict:
+        uptime = time.monotonic() - self.started_at if self.started_at else 0
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": self.queue_size,
+            "connections": self.connections,
+            "connections_opened": self.connections_opened,
+            "accepted": self.accepted,
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "avg_send_ms": round(self.send_seconds / self.sent * 1000, 2) if self.sent else None,
+            "emails_per_sec": round(self.sent / uptime, 2) if uptime else None,
+        }
+
+
+mailer = Mailer()
@@ -1,24 +1,21 @@
 # main.py
-from fastapi import FastAPI, HTTPException, Depends, status, Response, Request, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, status, Response, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
-from fastapi.responses import HTMLResponse, FileResponse
-from passlib.hash import bcrypt
-from jose import JWTError, jwt
-from pydantic import BaseModel, EmailStr
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from typing import Optional, List
+import os
 import random
+import secrets
 import string
 from bson import ObjectId
 from datetime import datetime, timedelta, timezone
 from contextlib import asynccontextmanager
-import smtplib
-from email.mime.text import MIMEText
 from pathlib import Path
 
 from database import (
-    connect_to_mongo, close_mongo_connection, get_student_collection,
-    get_token_blacklist_collection, get_receipt_collection,
+    connect_to_mongo, close_mongo_connection, get_collection, get_student_collection,
+    get_receipt_collection,
     get_password_reset_collection,
     get_favorite_videos_collection,
     get_educational_content_collection,
@@ -28,20 +25,21 @@ from database import (
     get_admins_collection,
     get_teachers_collection,
     get_payments_collection,
-    get_paymob_logs_collection
+    get_sessions_collection,
+    STUDENT_LIST_PROJECTION, TEACHER_LIST_PROJECTION, PAYMENT_LIST_PROJECTION
 )
 from schemas import (
     RegisterRequest, LoginRequest, TokenResponse, RefreshTokenResponse,
     StudentEditRequest, StudentProfileResponse,
     ReceiptCreate, ReceiptResponse,
     ForgotPasswordRequest, VerifyResetCodeRequest, ResetPasswordRequest,
-    ChapterSummaryResponse, LessonSummaryResponse, LessonDetailResponse,
+    ChapterSummaryResponse,
     BookResponse, ItemPurchaseRequest, TestResultResponse,
     AddTestResultRequest, VideoResponse, FavoriteVideoRequest,
     ParentLoginRequest, ParentDashboardResponse, LoginResponseWithData,
     LessonResponseV2,
     # New Admin Schemas
-    AdminLoginRequest, AdminTokenResponse, ContentUpdate,
+    AdminLoginRequest, AdminTokenResponse,
     BookCreateRequest, BookUpdateRequest,
     AdminRegisterRequest, AdminProfileResponse,
     ChapterCreateRequest, ChapterUpdateRequest,
@@ -50,6 +48,26 @@ from schemas import (
     TeacherCreateRequest, TeacherLoginRequest, TeacherProfileResponse, TeacherUpdateRequest
 )
 from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from content_cache import content_cache
+from content_store import content_store, ChapterNotFound
+from passwords import password_hasher, PasswordHasherBusy
+from caching import TTLCache
+from tokens import create_token, decode_token, token_hash, token_cache
+from blacklist import token_blacklist
+from mongo_metrics import mongo_metrics
+from pagination import PageParams, page_params, fetch_page, NEXT_CURSOR_HEADER
+from exports import EXPORTS, MEDIA_TYPES, build_query, stream_export
+from dashboard import build_dashboard, record_receipt
+from entitlements import grant_from_receipt, purchased_chapter_ids
+from log_sink import audit_sink
+from mailer import mailer, MailerBusy
+from render_cache import render_cache, render_lesson
+from http_cache import catalog_responder
+from compression import CompressionMiddleware, compressor
+import singleflight
+from json_response import mongo_json
 
 GRADE_MAP = {
     "10": "الصف الأول الثانوي",
@@ -82,44 +100,118 @@ def convert_dict_keys_to_str(d):
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await connect_to_mongo()
+    audit_sink.start(get_collection)
+    await content_store.ensure_indexes()
+    await content_cache.refresh()
+    content_cache.start_watcher()
+    await password_hasher.warm_up()
+    await token_blacklist.start()
+    mailer.start()
     yield
+    await mailer.close()
+    await token_blacklist.stop()
+    password_hasher.shutdown()
+    await content_cache.stop_watcher()
     await close_mongo_connection()
 
 app = FastAPI(lifespan=lifespan)
 
 # --- Configuration & Middleware ---
-SECRET_KEY = "Ea$yB1o"
-ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 15
 REFRESH_TOKEN_EXPIRE_DAYS = 7
-SMTP_HOST, SMTP_PORT = 'smtp.hostinger.com', 587
-SMTP_USERNAME, SMTP_PASSWORD = 'noreply@easybio-drabdelrahman.com', 'Webacc@123'
+# Trust the student_code / grade claims in access tokens instead of loading the student per request
+STATELESS_AUTH = os.environ.get("STATELESS_AUTH", "1") == "1"
+# Refresh-token sessions allowed per student; 0 means unlimited
+MAX_ACTIVE_SESSIONS = int(os.environ.get("MAX_ACTIVE_SESSIONS", "0"))
+PRINCIPAL_CACHE_SIZE = int(os.environ.get("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.environ.get("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
 
+# Recently loaded student/admin/teacher documents keyed by "<role>:<id>"
+principal_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS)
+
+app.add_middleware(CompressionMiddleware, compressor=compressor)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*", "http://localhost:5173", "http://localhost:8000", "https://easybio2025.netlify.app"],
     allow_credentials=True, allow_methods=["*"], allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# Record every admin write (who, what, result) in admin_audit_log
+AUDIT_ADMIN_REQUESTS = os.environ.get("AUDIT_ADMIN_REQUESTS", "1") == "1"
+
+class AdminAuditMiddleware:
+    """Pure ASGI, so every request other than an admin write passes straight through."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (not AUDIT_ADMIN_REQUESTS or scope["type"] != "http" or scope["method"] in ("GET", "HEAD", "OPTIONS")
+                or not scope["path"].startswith("/admin")):
+            await self.app(scope, receive, send)
+            return
+        started = datetime.now(timezone.utc)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request = Request(scope)
+            authorization = request.headers.get("authorization", "")
+            claims = decode_token(authorization[7:]) if authorization.lower().startswith("bearer ") else None
+            audit_sink.emit("admin_audit_log", {
+                "at": started,
+                "admin_id": claims.get("sub") if claims and claims.get("role") == "admin" else None,
+                "method": request.method,
+                "path": request.url.path,
+                "query": str(request.url.query) or None,
+                "status": status_code,
+                "duration_ms": round((datetime.now(timezone.utc) - started).total_seconds() * 1000, 2),
+                "client": request.client.host if request.client else None,
+            })
+
+app.add_middleware(AdminAuditMiddleware)
+
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, please try again."},
+        headers={"Retry-After": "1"}
+    )
+
+@app.exception_handler(MailerBusy)
+async def mailer_busy_handler(request: Request, exc: MailerBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many emails are waiting to be sent, please try again shortly."},
+        headers={"Retry-After": "30"}
+    )
+
 # --- Helper & Auth Functions ---
-def create_token(data: dict, expires_delta: timedelta):
-    to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + expires_delta
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-def create_access_token(subject: str): return create_token({"sub": subject}, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+def create_access_token(subject: str, student: dict = None):
+    claims = {"sub": subject}
+    if student:
+        # Enough for get_current_principal to identify the student without a DB read
+        claims.update({"role": "student", "student_code": student.get("student_code"), "grade": student.get("grade")})
+    return create_token(claims, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
 def create_refresh_token(subject: str):
     expire_delta, expire_utc = timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS), datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    return create_token({"sub": subject}, expire_delta), expire_utc
+    # jti keeps two logins in the same second from producing the same token (and session key)
+    return create_token({"sub": subject, "jti": secrets.token_hex(8)}, expire_delta), expire_utc
 def create_password_reset_token(email: str, scope: str, minutes: int): return create_token({"sub": email, "scope": scope}, timedelta(minutes=minutes))
-def verify_password(plain, hashed): return bcrypt.verify(plain, hashed)
-def hash_password(password): return bcrypt.hash(password)
+async def verify_password(plain, hashed): return await password_hasher.verify(plain, hashed)
+async def hash_password(password, kind="password"): return await password_hasher.hash(password, kind)
 def generate_student_code(): return ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-def decode_token(token: str):
-    try: return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    except JWTError: return None
 
 # --- Role-based token helpers ---
 def create_admin_access_token(admin_id: str):
@@ -127,20 +219,34 @@ def create_admin_access_token(admin_id: str):
 
 def create_teacher_access_token(teacher_id: str):
     return create_token({"sub": teacher_id, "role": "teacher"}, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-def send_password_reset_email(email: str, code: str):
-    msg = MIMEText(f"Your password reset code is: {code}\nIt is valid for 10 minutes.")
-    msg['Subject'], msg['From'], msg['To'] = 'Your Password Reset Code', SMTP_USERNAME, email
-    try:
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USERNAME, SMTP_PASSWORD)
-            server.send_message(msg)
-            print(f"Password reset code sent to {email}")
-    except Exception as e: print(f"Failed to send email to {email}. Error: {e}")
+async def _load_principal(role: str, sub: str, collection: AsyncIOMotorCollection):
+    key = f"{role}:{sub}"
+    doc = principal_cache.get(key)
+    if doc is None:
+        doc = await collection.find_one({"_id": ObjectId(sub)}, {"active_refresh_tokens": 0})
+        if doc:
+            principal_cache.set(key, doc)
+    # Callers reshape the document (e.g. format_student_grade), so never hand out the cached one
+    return dict(doc) if doc else None
+
+def invalidate_principal(role: str, user_id) -> None:
+    principal_cache.pop(f"{role}:{user_id}")
+
 async def get_current_student(token: str = Depends(oauth2_scheme), student_collection: AsyncIOMotorCollection = Depends(get_student_collection)):
     payload = decode_token(token)
     if not payload or not (sub := payload.get("sub")): raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid token")
-    student = await student_collection.find_one({"_id": ObjectId(sub)})
+    student = await _load_principal("student", sub, student_collection)
+    if not student: raise HTTPException(status.HTTP_404_NOT_FOUND, "Student not found")
+    return student
+
+async def get_current_principal(token: str = Depends(oauth2_scheme), student_collection: AsyncIOMotorCollection = Depends(get_student_collection)):
+    """The calling student's _id, student_code and grade; read from the token when it carries them."""
+    payload = decode_token(token)
+    if not payload or not (sub := payload.get("sub")): raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid token")
+    if STATELESS_AUTH and payload.get("role") == "student" and payload.get("student_code"):
+        return {"_id": ObjectId(sub), "student_code": payload["student_code"], "grade": payload.get("grade")}
+    # Tokens issued before the claims were added
+    student = await _load_principal("student", sub, student_collection)
     if not student: raise HTTPException(status.HTTP_404_NOT_FOUND, "Student not found")
     return student
 
@@ -148,7 +254,7 @@ async def get_current_admin(token: str = Depends(oauth2_scheme), admins: AsyncIO
     payload = decode_token(token)
     if not payload or payload.get("role") != "admin" or not (sub := payload.get("sub")):
         raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid admin token")
-    admin = await admins.find_one({"_id": ObjectId(sub)})
+    admin = await _load_principal("admin", sub, admins)
     if not admin:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Admin not found")
     return admin
@@ -157,7 +263,7 @@ async def get_current_teacher(token: str = Depends(oauth2_scheme), teachers: Asy
     payload = decode_token(token)
     if not payload or payload.get("role") != "teacher" or not (sub := payload.get("sub")):
         raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid teacher token")
-    teacher = await teachers.find_one({"_id": ObjectId(sub)})
+    teacher = await _load_principal("teacher", sub, teachers)
     if not teacher:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Teacher not found")
     return teacher
@@ -165,20 +271,9 @@ async def get_current_teacher(token: str = Depends(oauth2_scheme), teachers: Asy
 # Add a new helper function to find content details
 async def find_item_in_content_by_id(item_id_to_find: int):
     """Finds a chapter or lesson by its ID in the database content."""
-    edu_collection = await get_educational_content_collection()
-    edu_doc = await edu_collection.find_one({})
-    if not edu_doc:
-        return None
-    content = edu_doc.get("content", {})
-    # Iterate through the converted string keys
-    for year_content in content.values():
-        for term_content in year_content.values():
-            for lang_content in term_content.values():
-                for subject_content in lang_content.values():
-                    # Check for the item with the converted string key
-                    if str(item_id_to_find) in subject_content.get("chapters", {}):
-                        return subject_content["chapters"][str(item_id_to_find)]
-    return None
+    index = await content_cache.get_index()
+    entry = index.chapter(int(item_id_to_find)) if index else None
+    return entry[1] if entry else None
 
 # --- API Endpoints ---
 @app.get("/")
@@ -198,7 +293,7 @@ async def admin_register(
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Admin already exists")
     admin_doc = {
         "email": data.email,
-        "password": hash_password(data.password),
+        "password": await hash_password(data.password),
         "name": data.name,
         "role": data.role,
         "created_at": datetime.now(timezone.utc)
@@ -215,7 +310,7 @@ async def admin_login(
     admins: AsyncIOMotorCollection = Depends(get_admins_collection)
 ):
     admin = await admins.find_one({"email": data.email})
-    if not admin or not verify_password(data.password, admin.get("password", "")):
+    if not admin or not await verify_password(data.password, admin.get("password", "")):
         raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid credentials")
     token = create_admin_access_token(str(admin["_id"]))
     return {"access_token": token, "token_type": "bearer"}
@@ -244,7 +339,7 @@ async def teacher_register(
         "name": data.name,
         "email": data.email,
         "phone": data.phone,
-        "password": hash_password(data.password),
+        "password": await hash_password(data.password),
         "role": "teacher",
         "created_at": datetime.now(timezone.utc)
     }
@@ -260,7 +355,7 @@ async def teacher_login(
     teachers: AsyncIOMotorCollection = Depends(get_teachers_collection)
 ):
     teacher = await teachers.find_one({"email": data.email})
-    if not teacher or not verify_password(data.password, teacher.get("password", "")):
+    if not teacher or not await verify_password(data.password, teacher.get("password", "")):
         raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid credentials")
     token = create_teacher_access_token(str(teacher["_id"]))
     return {"access_token": token, "token_type": "bearer"}
@@ -277,198 +372,146 @@ async def teacher_profile(current_teacher: dict = Depends(get_current_teacher)):
 # ADMIN CONTENT MANAGEMENT
 # ----------------------
 
-async def _get_or_create_content_doc(edu_collection: AsyncIOMotorCollection) -> dict:
-    doc = await edu_collection.find_one({"content": {"$exists": True}})
-    if not doc:
-        result = await edu_collection.insert_one({"content": {}, "created_at": datetime.now(timezone.utc)})
-        doc = await edu_collection.find_one({"_id": result.inserted_id})
-    return doc
-
-def _ensure_subject_path(content_root: dict, year: str, term: str, language: str, subject: str) -> None:
-    content_root.setdefault(year, {})
-    content_root[year].setdefault(term, {})
-    content_root[year][term].setdefault(language, {})
-    content_root[year][term][language].setdefault(subject, {"chapters": {}, "lessons": {}})
+def _content_path(year: str, term: str, language: str, subject: str) -> tuple:
+    # Path segments become Mongo field names, so they can't contain "." or start with "$"
+    path = (year, term, language, subject)
+    if any("." in part or part.startswith("$") for part in path):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid content path")
+    return path
 
 @app.get("/admin/content/{year}/{term}/{language}/{subject}")
 async def admin_get_subject_content(
     year: str, term: str, language: str, subject: str,
-    _: dict = Depends(get_current_admin),
-    edu_collection: AsyncIOMotorCollection = Depends(get_educational_content_collection)
+    _: dict = Depends(get_current_admin)
 ):
-    doc = await _get_or_create_content_doc(edu_collection)
-    content = doc.get("content", {})
-    _ensure_subject_path(content, year, term, language, subject)
-    await edu_collection.update_one({"_id": doc["_id"]}, {"$set": {"content": content}})
-    return content[year][term][language][subject]
+    node, created = await content_store.get_subject(_content_path(year, term, language, subject))
+    # Only adding a missing subject changes the content (and its version); plain reads keep the caches
+    if created:
+        content_cache.invalidate()
+    return mongo_json(node)
 
 @app.post("/admin/content/{year}/{term}/{language}/{subject}/chapters")
 async def admin_create_chapter(
     year: str, term: str, language: str, subject: str,
     body: ChapterCreateRequest,
-    _: dict = Depends(get_current_admin),
-    edu_collection: AsyncIOMotorCollection = Depends(get_educational_content_collection)
+    _: dict = Depends(get_current_admin)
 ):
-    doc = await _get_or_create_content_doc(edu_collection)
-    content = doc.get("content", {})
-    _ensure_subject_path(content, year, term, language, subject)
-    chapters = content[year][term][language][subject]["chapters"]
-    new_id = 1
-    if chapters:
-        try:
-            new_id = max(int(k) for k in chapters.keys()) + 1
-        except Exception:
-            new_id = 1
-    chapters[str(new_id)] = {
+    new_id, chapter = await content_store.create_chapter(_content_path(year, term, language, subject), {
         "title": body.title,
         "price": f"{body.price} جنية"
-    }
-    await edu_collection.update_one({"_id": doc["_id"]}, {"$set": {"content": content}})
-    return {"id": new_id, **chapters[str(new_id)]}
+    })
+    content_cache.invalidate()
+    return {"id": new_id, **chapter}
 
 @app.put("/admin/content/{year}/{term}/{language}/{subject}/chapters/{chapter_id}")
 async def admin_update_chapter(
     year: str, term: str, language: str, subject: str, chapter_id: int,
     body: ChapterUpdateRequest,
-    _: dict = Depends(get_current_admin),
-    edu_collection: AsyncIOMotorCollection = Depends(get_educational_content_collection)
+    _: dict = Depends(get_current_admin)
 ):
-    doc = await _get_or_create_content_doc(edu_collection)
-    content = doc.get("content", {})
-    _ensure_subject_path(content, year, term, language, subject)
-    chapters = content[year][term][language][subject]["chapters"]
-    key = str(chapter_id)
-    if key not in chapters:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "Chapter not found")
+    fields = {}
     if body.title is not None:
-        chapters[key]["title"] = body.title
+        fields["title"] = body.title
     if body.price is not None:
-        chapters[key]["price"] = f"{body.price} جنية"
-    await edu_collection.update_one({"_id": doc["_id"]}, {"$set": {"content": content}})
-    return {"id": chapter_id, **chapters[key]}
+        fields["price"] = f"{body.price} جنية"
+    chapter = await content_store.update_chapter(_content_path(year, term, language, subject), chapter_id, fields)
+    if chapter is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Chapter not found")
+    content_cache.invalidate()
+    return {"id": chapter_id, **chapter}
 
 @app.delete("/admin/content/{year}/{term}/{language}/{subject}/chapters/{chapter_id}")
 async def admin_delete_chapter(
     year: str, term: str, language: str, subject: str, chapter_id: int,
-    _: dict = Depends(get_current_admin),
-    edu_collection: AsyncIOMotorCollection = Depends(get_educational_content_collection)
+    _: dict = Depends(get_current_admin)
 ):
-    doc = await _get_or_create_content_doc(edu_collection)
-    content = doc.get("content", {})
-    _ensure_subject_path(content, year, term, language, subject)
-    chapters = content[year][term][language][subject]["chapters"]
-    key = str(chapter_id)
-    if key not in chapters:
+    # The store removes all lessons that belong to this chapter as well
+    deleted = await content_store.delete_chapter(_content_path(year, term, language, subject), chapter_id)
+    if deleted is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Chapter not found")
-    # Remove all lessons that belong to this chapter as well
-    lessons = content[year][term][language][subject]["lessons"]
-    to_delete_lessons = [lid for lid, ldata in lessons.items() if ldata.get("chapter_id") == chapter_id]
-    for lid in to_delete_lessons:
-        lessons.pop(lid, None)
-    deleted = chapters.pop(key)
-    await edu_collection.update_one({"_id": doc["_id"]}, {"$set": {"content": content}})
+    content_cache.invalidate()
     return {"message": "Chapter deleted", "deleted": {"id": chapter_id, **deleted}}
 
 @app.post("/admin/content/{year}/{term}/{language}/{subject}/lessons")
 async def admin_create_lesson(
     year: str, term: str, language: str, subject: str,
     body: LessonCreateRequest,
-    _: dict = Depends(get_current_admin),
-    edu_collection: AsyncIOMotorCollection = Depends(get_educational_content_collection)
+    _: dict = Depends(get_current_admin)
 ):
-    doc = await _get_or_create_content_doc(edu_collection)
-    content = doc.get("content", {})
-    _ensure_subject_path(content, year, term, language, subject)
-    subject_node = content[year][term][language][subject]
-    if str(body.chapter_id) not in subject_node["chapters"]:
+    try:
+        new_id, lesson = await content_store.create_lesson(_content_path(year, term, language, subject), {
+            "title": body.title,
+            "chapter_id": int(body.chapter_id),
+            "price": f"{body.price} جنية",
+            "description": body.description or "",
+            "vimeo_embed_src": body.vimeo_embed_src or "",
+            "image_url": body.image_url or "",
+            "hours": float(body.hours or 0),
+            "lecture": body.lecture or "",
+            "isFree": bool(body.isFree)
+        })
+    except ChapterNotFound:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "chapter_id does not exist")
-    lessons = subject_node["lessons"]
-    new_id = 1
-    if lessons:
-        try:
-            new_id = max(int(k) for k in lessons.keys()) + 1
-        except Exception:
-            new_id = 1
-    lessons[str(new_id)] = {
-        "title": body.title,
-        "chapter_id": int(body.chapter_id),
-        "price": f"{body.price} جنية",
-        "description": body.description or "",
-        "vimeo_embed_src": body.vimeo_embed_src or "",
-        "image_url": body.image_url or "",
-        "hours": float(body.hours or 0),
-        "lecture": body.lecture or "",
-        "isFree": bool(body.isFree)
-    }
-    await edu_collection.update_one({"_id": doc["_id"]}, {"$set": {"content": content}})
-    return {"id": new_id, **lessons[str(new_id)]}
+    content_cache.invalidate()
+    return {"id": new_id, **lesson}
 
 @app.put("/admin/content/{year}/{term}/{language}/{subject}/lessons/{lesson_id}")
 async def admin_update_lesson(
     year: str, term: str, language: str, subject: str, lesson_id: int,
     body: LessonUpdateRequest,
-    _: dict = Depends(get_current_admin),
-    edu_collection: AsyncIOMotorCollection = Depends(get_educational_content_collection)
+    _: dict = Depends(get_current_admin)
 ):
-    doc = await _get_or_create_content_doc(edu_collection)
-    content = doc.get("content", {})
-    _ensure_subject_path(content, year, term, language, subject)
-    node = content[year][term][language][subject]
-    lessons = node["lessons"]
-    key = str(lesson_id)
-    if key not in lessons:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "Lesson not found")
+    fields = {}
     if body.title is not None:
-        lessons[key]["title"] = body.title
+        fields["title"] = body.title
     if body.chapter_id is not None:
-        if str(body.chapter_id) not in node["chapters"]:
-            raise HTTPException(status.HTTP_400_BAD_REQUEST, "chapter_id does not exist")
-        lessons[key]["chapter_id"] = int(body.chapter_id)
+        fields["chapter_id"] = int(body.chapter_id)
     if body.price is not None:
-        lessons[key]["price"] = f"{body.price} جنية"
+        fields["price"] = f"{body.price} جنية"
     if body.description is not None:
-        lessons[key]["description"] = body.description
+        fields["description"] = body.description
     if body.vimeo_embed_src is not None:
-        lessons[key]["vimeo_embed_src"] = body.vimeo_embed_src
+        fields["vimeo_embed_src"] = body.vimeo_embed_src
     if body.image_url is not None:
-        lessons[key]["image_url"] = body.image_url
+        fields["image_url"] = body.image_url
     if body.hours is not None:
-        lessons[key]["hours"] = float(body.hours)
+        fields["hours"] = float(body.hours)
     if body.lecture is not None:
-        lessons[key]["lecture"] = body.lecture
+        fields["lecture"] = body.lecture
     if body.isFree is not None:
-        lessons[key]["isFree"] = bool(body.isFree)
-    await edu_collection.update_one({"_id": doc["_id"]}, {"$set": {"content": content}})
-    return {"id": lesson_id, **lessons[key]}
+        fields["isFree"] = bool(body.isFree)
+    try:
+        lesson = await content_store.update_lesson(_content_path(year, term, language, subject), lesson_id, fields)
+    except ChapterNotFound:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "chapter_id does not exist")
+    if lesson is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Lesson not found")
+    content_cache.invalidate()
+    return {"id": lesson_id, **lesson}
 
 @app.delete("/admin/content/{year}/{term}/{language}/{subject}/lessons/{lesson_id}")
 async def admin_delete_lesson(
     year: str, term: str, language: str, subject: str, lesson_id: int,
-    _: dict = Depends(get_current_admin),
-    edu_collection: AsyncIOMotorCollection = Depends(get_educational_content_collection)
+    _: dict = Depends(get_current_admin)
 ):
-    doc = await _get_or_create_content_doc(edu_collection)
-    content = doc.get("content", {})
-    _ensure_subject_path(content, year, term, language, subject)
-    lessons = content[year][term][language][subject]["lessons"]
-    key = str(lesson_id)
-    if key not in lessons:
+    deleted = await content_store.delete_lesson(_content_path(year, term, language, subject), lesson_id)
+    if deleted is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Lesson not found")
-    deleted = lessons.pop(key)
-    await edu_collection.update_one({"_id": doc["_id"]}, {"$set": {"content": content}})
+    content_cache.invalidate()
     return {"message": "Lesson deleted", "deleted": {"id": lesson_id, **deleted}}
 
-
 # ----------------------
 # BOOKS MANAGEMENT (ADMIN)
 # ----------------------
 
 @app.get("/admin/books", response_model=List[BookResponse])
 async def admin_list_books(
+    response: Response,
+    page: PageParams = Depends(page_params),
     _: dict = Depends(get_current_admin),
     books_collection: AsyncIOMotorCollection = Depends(get_books_collection)
 ):
-    return await books_collection.find().to_list(1000)
+    return await fetch_page(books_collection, {}, page, response)
 
 @app.post("/admin/books", response_model=BookResponse)
 async def admin_create_book(
@@ -480,6 +523,7 @@ async def admin_create_book(
     new_id = (existing[0]["id"] + 1) if existing else 1
     doc = {"id": new_id, "title": body.title, "price": body.price, "image": body.image}
     await books_collection.insert_one(doc)
+    render_cache.invalidate_books()
     return doc
 
 @app.put("/admin/books/{book_id}", response_model=BookResponse)
@@ -489,8 +533,9 @@ async def admin_update_book(
     _: dict = Depends(get_current_admin),
     books_collection: AsyncIOMotorCollection = Depends(get_books_collection)
 ):
-    update = {k: v for k, v in body.dict(exclude_unset=True).items()}
+    update = {k: v for k, v in body.model_dump(exclude_unset=True).items()}
     await books_collection.update_one({"id": book_id}, {"$set": update})
+    render_cache.invalidate_books()
     updated = await books_collection.find_one({"id": book_id})
     if not updated:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Book not found")
@@ -505,6 +550,7 @@ async def admin_delete_book(
     result = await books_collection.find_one_and_delete({"id": book_id})
     if not result:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Book not found")
+    render_cache.invalidate_books()
     return {"message": "Book deleted"}
 
 
@@ -532,7 +578,7 @@ async def _resolve_item_amount(item_type: str, item_id: str, edu_collection: Asy
 @app.post("/payments/initiate", response_model=PaymentInitiateResponse)
 async def initiate_payment(
     body: PaymentInitiateRequest,
-    current_student: dict = Depends(get_current_student),
+    current_student: dict = Depends(get_current_principal),
     payments: AsyncIOMotorCollection = Depends(get_payments_collection),
     edu_collection: AsyncIOMotorCollection = Depends(get_educational_content_collection)
 ):
@@ -553,56 +599,75 @@ async def initiate_payment(
     redirect_url = f"https://paymob.example/checkout/{merchant_order_id}"
     return {"merchant_order_id": merchant_order_id, "status": "pending", "redirect_url": redirect_url}
 
+async def _issue_payment_receipt(payment: dict, payments: AsyncIOMotorCollection, receipt_collection: AsyncIOMotorCollection, student_collection: AsyncIOMotorCollection):
+    """Writes the receipt for a paid payment at most once, keyed by its merchant_order_id."""
+    student_id = payment.get("student_id")
+    student_code = payment.get("student_code")
+    if not student_code and student_id:
+        student = await student_collection.find_one({"_id": ObjectId(student_id)}, {"student_code": 1})
+        student_code = student.get("student_code") if student else None
+    receipt = {
+        "student_id": student_id,
+        "student_code": student_code,
+        "receipt_type": "package_purchase",
+        "item_id": payment.get("item_id"),
+        "amount": float(payment.get("amount", 0.0)),
+        "description": f"Purchase of {payment.get('item_type')} {payment.get('item_id')} (Paymob)",
+        "merchant_order_id": payment["merchant_order_id"],
+        "created_at": datetime.now(timezone.utc)
+    }
+    try:
+        await receipt_collection.insert_one(receipt)
+    except DuplicateKeyError:
+        # A concurrent delivery of the same callback got there first
+        pass
+    else:
+        await record_receipt(receipt)
+        await grant_from_receipt(receipt)
+    await payments.update_one({"_id": payment["_id"]}, {"$set": {"receipt_issued": True}})
+
 @app.post("/payments/webhook")
 async def paymob_webhook(
     payload: dict,
     payments: AsyncIOMotorCollection = Depends(get_payments_collection),
-    paymob_logs: AsyncIOMotorCollection = Depends(get_paymob_logs_collection),
     receipt_collection: AsyncIOMotorCollection = Depends(get_receipt_collection),
     student_collection: AsyncIOMotorCollection = Depends(get_student_collection)
 ):
-    try:
-        await paymob_logs.insert_one({"payload": payload, "received_at": datetime.now(timezone.utc)})
-    except Exception:
-        pass
+    audit_sink.emit("paymob_logs", {"payload": payload, "received_at": datetime.now(timezone.utc)})
 
     merchant_order_id = payload.get("merchant_order_id") or payload.get("order"); paymob_order_id = payload.get("id") or payload.get("paymob_order_id")
     success = bool(payload.get("success") or payload.get("is_paid") or payload.get("successfully_paid"))
     if not merchant_order_id:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "merchant_order_id missing")
 
-    payment = await payments.find_one({"merchant_order_id": merchant_order_id})
-    if not payment:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "Payment not found")
-
+    # Only one delivery can win the transition: pending/failed -> paid, or pending -> failed.
+    # A paid payment is never downgraded by a late failure callback.
     new_status = "paid" if success else "failed"
-    await payments.update_one({"_id": payment["_id"]}, {"$set": {"status": new_status, "paymob_order_id": paymob_order_id, "webhook_payload": payload}})
-
-    if success:
-        # Create a receipt record for the student
-        student_id = payment.get("student_id")
-        student = await student_collection.find_one({"_id": ObjectId(student_id)}) if student_id else None
-        student_code = student.get("student_code") if student else None
-        receipt = {
-            "student_id": student_id,
-            "student_code": student_code,
-            "receipt_type": "package_purchase",
-            "item_id": payment.get("item_id"),
-            "amount": float(payment.get("amount", 0.0)),
-            "description": f"Purchase of {payment.get('item_type')} {payment.get('item_id')} (Paymob)",
-            "created_at": datetime.now(timezone.utc)
-        }
-        try:
-            await receipt_collection.insert_one(receipt)
-        except Exception:
-            pass
+    from_statuses = ["pending", "failed"] if success else ["pending"]
+    payment = await payments.find_one_and_update(
+        {"merchant_order_id": merchant_order_id, "status": {"$in": from_statuses}},
+        {"$set": {"status": new_status, "paymob_order_id": paymob_order_id, "webhook_payload": payload, "updated_at": datetime.now(timezone.utc)}},
+        projection=PAYMENT_LIST_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    if payment is None:
+        # Retry / duplicate delivery, or an unknown order
+        payment = await payments.find_one({"merchant_order_id": merchant_order_id}, PAYMENT_LIST_PROJECTION)
+        if not payment:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, "Payment not found")
+        if payment.get("status") != "paid" or payment.get("receipt_issued"):
+            return {"message": "ok"}
+        # Paid, but the receipt wasn't confirmed (e.g. the first delivery died midway)
+
+    if payment["status"] == "paid":
+        await _issue_payment_receipt(payment, payments, receipt_collection, student_collection)
 
     return {"message": "ok"}
 
 @app.get("/payments/status/{merchant_order_id}", response_model=PaymentStatusResponse)
 async def payment_status(
     merchant_order_id: str,
-    current_student: dict = Depends(get_current_student),
+    current_student: dict = Depends(get_current_principal),
     payments: AsyncIOMotorCollection = Depends(get_payments_collection)
 ):
     payment = await payments.find_one({"merchant_order_id": merchant_order_id, "student_id": str(current_student["_id"])})
@@ -617,21 +682,21 @@ async def payment_status(
 
 @app.get("/dashboard/my-payments")
 async def my_payments(
-    current_student: dict = Depends(get_current_student),
+    response: Response,
+    page: PageParams = Depends(page_params),
+    current_student: dict = Depends(get_current_principal),
     payments: AsyncIOMotorCollection = Depends(get_payments_collection)
 ):
-    cursor = payments.find({"student_id": str(current_student["_id"])})
-    docs = await cursor.to_list(1000)
-    for d in docs:
-        d["_id"] = str(d["_id"]) if "_id" in d else None
-    return docs
+    return mongo_json(await fetch_page(payments, {"student_id": str(current_student["_id"])}, page, response, projection=PAYMENT_LIST_PROJECTION), response)
 
 @app.get("/admin/payments")
 async def admin_list_payments(
+    response: Response,
+    page: PageParams = Depends(page_params),
     _: dict = Depends(get_current_admin),
     payments: AsyncIOMotorCollection = Depends(get_payments_collection)
 ):
-    return await payments.find().sort("created_at", -1).to_list(1000)
+    return mongo_json(await fetch_page(payments, {}, page, response, sort_field="created_at", projection=PAYMENT_LIST_PROJECTION), response)
 
 
 # ----------------------
@@ -639,60 +704,86 @@ async def admin_list_payments(
 # ----------------------
 
 @app.get("/admin/dashboard")
-async def admin_dashboard(
-    _: dict = Depends(get_current_admin),
-    student_collection: AsyncIOMotorCollection = Depends(get_student_collection),
-    receipt_collection: AsyncIOMotorCollection = Depends(get_receipt_collection),
-    books_collection: AsyncIOMotorCollection = Depends(get_books_collection),
-    payments: AsyncIOMotorCollection = Depends(get_payments_collection)
-):
-    total_students = await student_collection.count_documents({})
-    total_receipts = await receipt_collection.count_documents({})
-    receipts_cursor = receipt_collection.find({}, {"amount": 1})
-    receipts = await receipts_cursor.to_list(10000)
-    total_revenue = sum(float(r.get("amount", 0)) for r in receipts)
-    total_books = await books_collection.count_documents({})
-    recent_payments = await payments.find().sort("created_at", -1).limit(10).to_list(10)
-    return {
-        "total_students": total_students,
-        "total_receipts": total_receipts,
-        "total_revenue": total_revenue,
-        "total_books": total_books,
-        "recent_payments": recent_payments
-    }
+async def admin_dashboard(_: dict = Depends(get_current_admin)):
+    return mongo_json(await build_dashboard())
+
+@app.get("/admin/metrics")
+async def admin_metrics(_: dict = Depends(get_current_admin)):
+    return mongo_json({
+        "content_cache": content_cache.stats(),
+        "passwords": password_hasher.stats(),
+        "principal_cache": principal_cache.stats(),
+        "token_cache": token_cache.stats(),
+        "token_blacklist": token_blacklist.stats(),
+        "mongo": mongo_metrics.stats(),
+        "audit_sink": audit_sink.stats(),
+        "mailer": mailer.stats(),
+        "render_cache": render_cache.stats(),
+        "catalog_http": catalog_responder.stats(),
+        "compression": compressor.stats(),
+        "singleflight": singleflight.stats()
+    })
 
 @app.get("/admin/students")
 async def admin_list_students(
+    response: Response,
+    page: PageParams = Depends(page_params),
     _: dict = Depends(get_current_admin),
     student_collection: AsyncIOMotorCollection = Depends(get_student_collection)
 ):
-    # Note: This returns hashed passwords, so we remove them
-    students = await student_collection.find().to_list(1000)
-    for s in students:
-        s.pop("password", None)
-        s["_id"] = str(s["_id"]) if "_id" in s else None
-    return students
+    return mongo_json(await fetch_page(student_collection, {}, page, response, projection=STUDENT_LIST_PROJECTION), response)
 
 @app.get("/admin/receipts")
 async def admin_list_receipts(
+    response: Response,
+    page: PageParams = Depends(page_params),
     _: dict = Depends(get_current_admin),
     receipt_collection: AsyncIOMotorCollection = Depends(get_receipt_collection)
 ):
-    receipts = await receipt_collection.find().sort("created_at", -1).to_list(1000)
-    for r in receipts:
-        r["_id"] = str(r["_id"]) if "_id" in r else None
-    return receipts
+    return mongo_json(await fetch_page(receipt_collection, {}, page, response, sort_field="created_at"), response)
 
 @app.get("/admin/teachers")
 async def admin_list_teachers(
+    response: Response,
+    page: PageParams = Depends(page_params),
     _: dict = Depends(get_current_admin),
     teachers: AsyncIOMotorCollection = Depends(get_teachers_collection)
 ):
-    docs = await teachers.find().to_list(1000)
-    for d in docs:
-        d.pop("password", None)
-        d["_id"] = str(d["_id"]) if "_id" in d else None
-    return docs
+    return mongo_json(await fetch_page(teachers, {}, page, response, projection=TEACHER_LIST_PROJECTION), response)
+
+# ----------------------
+# EXPORTS (ADMIN)
+# ----------------------
+
+EXPORT_COLLECTIONS = {
+    "students": get_student_collection,
+    "receipts": get_receipt_collection,
+    "payments": get_payments_collection,
+}
+
+@app.get("/admin/export/{kind}")
+async def admin_export(
+    kind: str,
+    format: str = "ndjson",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    student_code: Optional[str] = None,
+    _: dict = Depends(get_current_admin)
+):
+    """Streams a whole collection as NDJSON or CSV, optionally filtered by [start, end) and student_code."""
+    spec = EXPORTS.get(kind)
+    if spec is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Unknown export.")
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "format must be 'ndjson' or 'csv'.")
+    collection = await EXPORT_COLLECTIONS[kind]()
+    query = build_query(spec, start, end, student_code)
+    filename = f"{kind}-{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}.{format}"
+    return StreamingResponse(
+        stream_export(collection, spec, query, format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 @app.put("/teacher/profile", response_model=TeacherProfileResponse)
 async def update_teacher_profile(
@@ -700,12 +791,13 @@ async def update_teacher_profile(
     current_teacher: dict = Depends(get_current_teacher),
     teachers: AsyncIOMotorCollection = Depends(get_teachers_collection)
 ):
-    update = {k: v for k, v in body.dict(exclude_unset=True).items()}
+    update = {k: v for k, v in body.model_dump(exclude_unset=True).items()}
     if "password" in update and update["password"]:
-        update["password"] = hash_password(update["password"])
+        update["password"] = await hash_password(update["password"])
     elif "password" in update:
         update.pop("password", None)
     await teachers.update_one({"_id": current_teacher["_id"]}, {"$set": update})
+    invalidate_principal("teacher", current_teacher["_id"])
     updated = await teachers.find_one({"_id": current_teacher["_id"]})
     updated["_id"] = str(updated["_id"])
     updated.pop("password", None)
@@ -718,14 +810,13 @@ async def register(data: RegisterRequest, students: AsyncIOMotorCollection = Dep
     if data.password != data.confirm_password:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Passwords do not match")
 
-    s_data = data.dict()
+    s_data = data.model_dump()
     if s_data.get("grade") in GRADE_MAP_REVERSE:
         s_data["grade"] = GRADE_MAP_REVERSE[s_data["grade"]]
 
     s_data.pop("confirm_password")
-    s_data["password"] = hash_password(data.password)
+    s_data["password"] = await hash_password(data.password)
     s_data["student_code"] = generate_student_code()
-    s_data["active_refresh_tokens"] = []
     await students.insert_one(s_data)
     return {"message": "Registered successfully. Please login."}
 
@@ -733,19 +824,24 @@ async def register(data: RegisterRequest, students: AsyncIOMotorCollection = Dep
 ############ LOGIN ################
 
 @app.post("/login", response_model=LoginResponseWithData)
-async def login(response: Response, data: LoginRequest, students: AsyncIOMotorCollection = Depends(get_student_collection)):
-    student = await students.find_one({"$or": [{"phone": data.identifier}, {"email": data.identifier}, {"student_code": data.identifier}]})
-    if not student or not verify_password(data.password, student["password"]):
+async def login(response: Response, data: LoginRequest, students: AsyncIOMotorCollection = Depends(get_student_collection), sessions: AsyncIOMotorCollection = Depends(get_sessions_collection)):
+    student = await students.find_one({"$or": [{"phone": data.identifier}, {"email": data.identifier}, {"student_code": data.identifier}]}, {"active_refresh_tokens": 0})
+    if not student or not await verify_password(data.password, student["password"]):
         raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid credentials")
     
-    if len(student.get("active_refresh_tokens", [])) >= 30000000:
+    if MAX_ACTIVE_SESSIONS and await sessions.count_documents({"student_id": student["_id"]}) >= MAX_ACTIVE_SESSIONS:
         raise HTTPException(status.HTTP_403_FORBIDDEN, "Max devices reached.")
     
     student_id = str(student["_id"])
-    access_token = create_access_token(student_id)
+    access_token = create_access_token(student_id, student)
     refresh_token, refresh_expire = create_refresh_token(student_id)
 
-    await students.update_one({"_id": student["_id"]}, {"$push": {"active_refresh_tokens": refresh_token}})
+    await sessions.insert_one({
+        "token_hash": token_hash(refresh_token),
+        "student_id": student["_id"],
+        "created_at": datetime.now(timezone.utc),
+        "expire_at": refresh_expire
+    })
 
     response.set_cookie(
         "refresh_token",
@@ -769,15 +865,18 @@ async def login(response: Response, data: LoginRequest, students: AsyncIOMotorCo
 ############ LOGOUT ################
 
 @app.post("/logout")
-async def logout(response: Response, request: Request, student_collection: AsyncIOMotorCollection = Depends(get_student_collection), blacklist: AsyncIOMotorCollection = Depends(get_token_blacklist_collection)):
+async def logout(response: Response, request: Request, student_collection: AsyncIOMotorCollection = Depends(get_student_collection), sessions: AsyncIOMotorCollection = Depends(get_sessions_collection)):
     refresh_token = request.cookies.get("refresh_token")
     if not refresh_token:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "No active session.")
     payload = decode_token(refresh_token)
     if payload and (student_id := payload.get("sub")):
-        await student_collection.update_one({"_id": ObjectId(student_id)}, {"$pull": {"active_refresh_tokens": refresh_token}})
+        result = await sessions.delete_one({"token_hash": token_hash(refresh_token)})
+        if result.deleted_count == 0:
+            # Logged in before sessions moved out of the student document
+            await student_collection.update_one({"_id": ObjectId(student_id)}, {"$pull": {"active_refresh_tokens": refresh_token}})
         expire_time = datetime.fromtimestamp(payload.get("exp"), tz=timezone.utc)
-        await blacklist.insert_one({"token": refresh_token, "expire_at": expire_time})
+        await token_blacklist.revoke(refresh_token, expire_time)
     response.delete_cookie("refresh_token")
     return {"message": "Successfully logged out"}
 
@@ -785,25 +884,43 @@ async def logout(response: Response, request: Request, student_collection: Async
 ############ REFRESH TOKEN ################
 
 @app.post("/token/refresh", response_model=RefreshTokenResponse)
-async def refresh(request: Request, response: Response, student_collection: AsyncIOMotorCollection = Depends(get_student_collection), blacklist: AsyncIOMotorCollection = Depends(get_token_blacklist_collection)):
+async def refresh(request: Request, response: Response, student_collection: AsyncIOMotorCollection = Depends(get_student_collection), sessions: AsyncIOMotorCollection = Depends(get_sessions_collection)):
     old_refresh_token = request.cookies.get("refresh_token")
     if not old_refresh_token: raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Refresh token missing")
-    if await blacklist.find_one({"token": old_refresh_token}): raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Session logged out")
+    if await token_blacklist.is_revoked(old_refresh_token): raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Session logged out")
     payload = decode_token(old_refresh_token)
     if not payload or not (student_id := payload.get("sub")): raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid refresh token")
-    student = await student_collection.find_one({"_id": ObjectId(student_id)})
-    if not student or old_refresh_token not in student.get("active_refresh_tokens", []): raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Token no longer valid")
-    new_access_token, (new_refresh_token, new_refresh_expire) = create_access_token(student_id), create_refresh_token(student_id)
-    await student_collection.update_one({"_id": ObjectId(student_id)}, {"$pull": {"active_refresh_tokens": old_refresh_token}})
-    await student_collection.update_one({"_id": ObjectId(student_id)}, {"$push": {"active_refresh_tokens": new_refresh_token}})
+    student = await student_collection.find_one({"_id": ObjectId(student_id)}, {"student_code": 1, "grade": 1})
+    if not student: raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Token no longer valid")
+    new_access_token, (new_refresh_token, new_refresh_expire) = create_access_token(student_id, student), create_refresh_token(student_id)
+    # Rotation is a single atomic swap, so a replayed refresh token can only win once
+    rotated = await sessions.find_one_and_update(
+        {"token_hash": token_hash(old_refresh_token), "student_id": student["_id"]},
+        {"$set": {"token_hash": token_hash(new_refresh_token), "expire_at": new_refresh_expire, "rotated_at": datetime.now(timezone.utc)}},
+        projection={"_id": 1}
+    )
+    if not rotated:
+        # Logged in before sessions moved out of the student document: move it over on first refresh
+        legacy = await student_collection.find_one_and_update(
+            {"_id": student["_id"], "active_refresh_tokens": old_refresh_token},
+            {"$pull": {"active_refresh_tokens": old_refresh_token}},
+            projection={"_id": 1}
+        )
+        if not legacy: raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Token no longer valid")
+        await sessions.insert_one({
+            "token_hash": token_hash(new_refresh_token),
+            "student_id": student["_id"],
+            "created_at": datetime.now(timezone.utc),
+            "expire_at": new_refresh_expire
+        })
     response.set_cookie("refresh_token", new_refresh_token, expires=new_refresh_expire, httponly=True, secure=True, samesite="none")
     return {"access_token": new_access_token, "refresh_token": new_refresh_token}
 
 ############ FORGET PASS ################
 
 @app.post("/forgot-password")
-async def forgot_password(data: ForgotPasswordRequest, background_tasks: BackgroundTasks, students: AsyncIOMotorCollection = Depends(get_student_collection), reset_codes: AsyncIOMotorCollection = Depends(get_password_reset_collection)):
-    student = await students.find_one({"email": data.email})
+async def forgot_password(data: ForgotPasswordRequest, students: AsyncIOMotorCollection = Depends(get_student_collection), reset_codes: AsyncIOMotorCollection = Depends(get_password_reset_collection)):
+    student = await students.find_one({"email": data.email}, {"_id": 1})
     if not student:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -811,7 +928,7 @@ async def forgot_password(data: ForgotPasswordRequest, background_tasks: Backgro
         )
 
     code = str(random.randint(10000, 99999))
-    hashed_code = hash_password(code)
+    hashed_code = await hash_password(code, kind="reset_code")
     expire_at = datetime.now(timezone.utc) + timedelta(minutes=10)
 
     await reset_codes.update_one(
@@ -820,7 +937,7 @@ async def forgot_password(data: ForgotPasswordRequest, background_tasks: Backgro
         upsert=True
     )
 
-    background_tasks.add_task(send_password_reset_email, data.email, code)
+    mailer.send_password_reset(data.email, code)
     
     return {"message": "A password reset code has been sent to your email."}
 
@@ -829,7 +946,7 @@ async def forgot_password(data: ForgotPasswordRequest, background_tasks: Backgro
 @app.post("/verify-reset-code")
 async def verify_reset_code(data: VerifyResetCodeRequest, reset_codes: AsyncIOMotorCollection = Depends(get_password_reset_collection)):
     reset_request = await reset_codes.find_one({"email": data.email})
-    if not reset_request or not verify_password(data.code, reset_request["code"]):
+    if not reset_request or not await verify_password(data.code, reset_request["code"]):
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid or expired reset code.")
     await reset_codes.delete_one({"_id": reset_request["_id"]})
     permission_token = create_password_reset_token(data.email, "reset_password_permission", 5)
@@ -838,14 +955,16 @@ async def verify_reset_code(data: VerifyResetCodeRequest, reset_codes: AsyncIOMo
 ############ Reset PASS ################
 
 @app.post("/reset-password")
-async def reset_password(data: ResetPasswordRequest, students: AsyncIOMotorCollection = Depends(get_student_collection)):
+async def reset_password(data: ResetPasswordRequest, students: AsyncIOMotorCollection = Depends(get_student_collection), sessions: AsyncIOMotorCollection = Depends(get_sessions_collection)):
     payload = decode_token(data.token)
     if not payload or payload.get("scope") != "reset_password_permission": raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid token.")
     email = payload.get("sub")
     if not email: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid token payload.")
-    new_hashed_password = hash_password(data.new_password)
-    result = await students.update_one({"email": email}, {"$set": {"password": new_hashed_password, "active_refresh_tokens": []}})
-    if result.matched_count == 0: raise HTTPException(status.HTTP_404_NOT_FOUND, "Student not found.")
+    new_hashed_password = await hash_password(data.new_password)
+    updated = await students.find_one_and_update({"email": email}, {"$set": {"password": new_hashed_password}, "$unset": {"active_refresh_tokens": ""}}, projection={"_id": 1})
+    if not updated: raise HTTPException(status.HTTP_404_NOT_FOUND, "Student not found.")
+    await sessions.delete_many({"student_id": updated["_id"]})
+    invalidate_principal("student", updated["_id"])
     return {"message": "Password reset successfully."}
 
 ############ Get prof ################
@@ -859,7 +978,7 @@ async def get_student_profile(current_student: dict = Depends(get_current_studen
 
 @app.put("/student/profile/edit")
 async def edit_profile(data: StudentEditRequest, current_student: dict = Depends(get_current_student), student_collection: AsyncIOMotorCollection = Depends(get_student_collection)):
-    update_data = data.dict(exclude_unset=True)
+    update_data = data.model_dump(exclude_unset=True)
     if not update_data:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No data to update")
 
@@ -867,16 +986,17 @@ async def edit_profile(data: StudentEditRequest, current_student: dict = Depends
         update_data["grade"] = GRADE_MAP_REVERSE[update_data["grade"]]
 
     if "password" in update_data and update_data["password"]:
-        update_data["password"] = hash_password(update_data["password"])
+        update_data["password"] = await hash_password(update_data["password"])
     else:
         update_data.pop("password", None)
         
     await student_collection.update_one({"_id": current_student["_id"]}, {"$set": update_data})
+    invalidate_principal("student", current_student["_id"])
     updated_doc = await student_collection.find_one({"_id": current_student["_id"]})
     
     updated_doc = format_student_grade(updated_doc)
     
-    response_data = StudentProfileResponse(**updated_doc).dict()
+    response_data = StudentProfileResponse(**updated_doc).model_dump()
     response_data.pop("password", None)
     return {"message": "Profile updated", "student": response_data}
 
@@ -884,13 +1004,15 @@ async def edit_profile(data: StudentEditRequest, current_student: dict = Depends
 ############ Create rec ################
 
 @app.post("/receipts", response_model=ReceiptResponse)
-async def add_receipt(receipt_data: ReceiptCreate, student_collection: AsyncIOMotorCollection = Depends(get_student_collection), receipt_collection: AsyncIOMotorCollection = Depends(get_receipt_collection), _: dict = Depends(get_current_student)):
+async def add_receipt(receipt_data: ReceiptCreate, student_collection: AsyncIOMotorCollection = Depends(get_student_collection), receipt_collection: AsyncIOMotorCollection = Depends(get_receipt_collection), _: dict = Depends(get_current_principal)):
     target_student = await student_collection.find_one({"student_code": receipt_data.student_code})
     if not target_student: raise HTTPException(status.HTTP_404_NOT_FOUND, f"Student with code '{receipt_data.student_code}' not found.")
     student_id = str(target_student["_id"])
-    new_receipt_data = receipt_data.dict()
+    new_receipt_data = receipt_data.model_dump()
     new_receipt_data.update({"student_id": student_id, "created_at": datetime.now(timezone.utc)})
     result = await receipt_collection.insert_one(new_receipt_data)
+    await record_receipt(new_receipt_data)
+    await grant_from_receipt(new_receipt_data)
     created_receipt = await receipt_collection.find_one({"_id": result.inserted_id})
     created_receipt["_id"] = str(created_receipt["_id"])
     return created_receipt
@@ -898,249 +1020,55 @@ async def add_receipt(receipt_data: ReceiptCreate, student_collection: AsyncIOMo
 ############ Get rec ################
 
 @app.get("/receipts/{student_code}", response_model=List[ReceiptResponse])
-async def get_all_receipts_for_student(student_code: str, receipt_collection: AsyncIOMotorCollection = Depends(get_receipt_collection), _: dict = Depends(get_current_student)):
-    receipts_cursor = receipt_collection.find({"student_code": student_code})
-    receipts_list = await receipts_cursor.to_list(length=1000)
-    for receipt in receipts_list: receipt["_id"] = str(receipt["_id"])
-    return receipts_list
+async def get_all_receipts_for_student(student_code: str, response: Response, page: PageParams = Depends(page_params), receipt_collection: AsyncIOMotorCollection = Depends(get_receipt_collection), _: dict = Depends(get_current_principal)):
+    return await fetch_page(receipt_collection, {"student_code": student_code}, page, response)
 
 # --- EDUCATIONAL CONTENT ENDPOINTS ---
+
+# The public catalog routes below send pre-rendered JSON from render_cache through
+# catalog_responder (ETag/304 + Cache-Control); their response_model only documents the shape.
+
 ############ GET Home Page chapters ################
 
 @app.get("/homepage/{year}/{term}/{language}/{subject}", response_model=List[LessonResponseV2])
-async def get_homepage_chapters(year: str, term: str, language: str, subject: str, edu_collection: AsyncIOMotorCollection = Depends(get_educational_content_collection)):
-    content_doc = await edu_collection.find_one({"content": {"$exists": True}})
-    if not content_doc or year not in content_doc["content"] or term not in content_doc["content"][year] or language not in content_doc["content"][year][term] or subject not in content_doc["content"][year][term][language]:
-        return []
-
-    content = content_doc["content"][year][term][language][subject]
-    lessons_data = content.get("lessons", {})
-    chapters_data = content.get("chapters", {})
-    
-    lessons = []
-    for lesson_id, lesson_data in lessons_data.items():
-        price_str = lesson_data.get("price", "0 جنية").split()[0]
-        try:
-            price_val = float(price_str)
-        except (ValueError, IndexError):
-            price_val = 0.0
-
-        chapter_title = chapters_data.get(str(lesson_data.get("chapter_id")), {}).get("title")
-
-        lessons.append(LessonResponseV2(
-            id=str(lesson_id),
-            title=lesson_data.get("title"),
-            description=lesson_data.get("description", ""),
-            vimeo_embed_src=lesson_data.get("vimeo_embed_src"),
-            image_url=lesson_data.get("image_url"),
-            price=price_val,
-            hours=lesson_data.get("hours", 0),
-            lecture=lesson_data.get("lecture", ""),
-            course=f"{chapter_title} ({lesson_data.get('chapter_id')})" if chapter_title else ""
-        ))
-    return lessons
+async def get_homepage_chapters(request: Request, year: str, term: str, language: str, subject: str):
+    return catalog_responder.respond(request, await render_cache.lessons((year, term, language, subject), "all"))
 
 ############ GET chapters lessons ################
 
 @app.get("/chapters/{chapter_id}", response_model=List[LessonResponseV2])
-async def get_chapter_lessons(chapter_id: int, edu_collection: AsyncIOMotorCollection = Depends(get_educational_content_collection)):
-    lessons = []
-    found_lessons = False
-    chapter_title = None
-
-    edu_doc = await edu_collection.find_one({"content": {"$exists": True}})
-    if not edu_doc:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "Educational content not found.")
-    content = edu_doc.get("content", {})
-    
-    # Find the chapter title first
-    for year_data in content.values():
-        for term_data in year_data.values():
-            for lang_data in term_data.values():
-                for subject_data in lang_data.values():
-                    if str(chapter_id) in subject_data.get("chapters", {}):
-                        chapter_title = subject_data["chapters"][str(chapter_id)]["title"]
-                        break
-                if chapter_title:
-                    break
-            if chapter_title:
-                break
-        if chapter_title:
-            break
-            
-    if not chapter_title:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "Chapter not found.")
-
-    # Iterate through content to find lessons for the specified chapter
-    for year in content.values():
-        for term in year.values():
-            for language in term.values():
-                for subject in language.values():
-                    for lesson_id, lesson_data in subject.get("lessons", {}).items():
-                        if lesson_data.get("chapter_id") == chapter_id:
-                            found_lessons = True
-                            # Safely extract data with default values for missing keys
-                            price_str = lesson_data.get("price", "0 جنية").split()[0]
-                            try:
-                                price_val = float(price_str)
-                            except (ValueError, IndexError):
-                                price_val = 0.0
-                            
-                            # Use the same logic for the lesson's course and lecture
-                            course_string = f"{chapter_title} ({chapter_id})"
-                            lecture_string = f"Lecture {lesson_id}"
-
-                            lessons.append(LessonResponseV2(
-                                id=str(lesson_id),
-                                title=lesson_data.get("title"),
-                                description=lesson_data.get("description", ""),
-                                vimeo_embed_src=lesson_data.get("vimeo_embed_src"),
-                                image_url=lesson_data.get("image_url"),
-                                price=price_val,
-                                hours=lesson_data.get("hours", 0),
-                                lecture=lecture_string,
-                                course=course_string
-                            ))
-
-    if not found_lessons:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "Chapter has no lessons.")
-        
-    return lessons
+async def get_chapter_lessons(request: Request, chapter_id: int):
+    return catalog_responder.respond(request, await render_cache.chapter(chapter_id))
 
 # --- GET Lesson Details
 @app.get("/lessons/{lesson_id}", response_model=LessonResponseV2)
-async def get_lesson_details(lesson_id: int, edu_collection: AsyncIOMotorCollection = Depends(get_educational_content_collection)):
-    edu_doc = await edu_collection.find_one({"content": {"$exists": True}})
-    if not edu_doc:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "Educational content not found.")
-    content = edu_doc.get("content", {})
-    
-    lesson_summary = None
-    chapter_title = None
-
-    for year in content.values():
-        for term in year.values():
-            for language in term.values():
-                for subject in language.values():
-                    if str(lesson_id) in subject.get("lessons", {}): 
-                        lesson_summary = subject["lessons"][str(lesson_id)]
-                        chapter_title = subject.get("chapters", {}).get(str(lesson_summary.get("chapter_id")), {}).get("title")
-                        break
-                if lesson_summary:
-                    break
-            if lesson_summary:
-                break
-    
-    if not lesson_summary: 
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "Lesson not found.")
-
-    price_str = lesson_summary.get("price", "0 جنية").split()[0]
-    try:
-        price_val = float(price_str)
-    except (ValueError, IndexError):
-        price_val = 0.0
-    
-    course_string = f"{chapter_title} ({lesson_summary.get('chapter_id')})" if chapter_title else ""
-    lecture_string = f"Lecture {lesson_id}"
-
-    return LessonResponseV2(
-        id=str(lesson_id),
-        title=lesson_summary.get("title"),
-        description=lesson_summary.get("description", ""),
-        vimeo_embed_src=lesson_summary.get("vimeo_embed_src"),
-        image_url=lesson_summary.get("image_url"),
-        price=price_val,
-        hours=lesson_summary.get("hours", 0),
-        lecture=lecture_string,
-        course=course_string
-    )
+async def get_lesson_details(request: Request, lesson_id: int):
+    return catalog_responder.respond(request, await render_cache.lesson(lesson_id))
 
 
 
 
 ############ GET Free Chapters ################
 @app.get("/homepage/{year}/{term}/{language}/{subject}/free", response_model=List[LessonResponseV2])
-async def get_free_chapters(year: str, term: str, language: str, subject: str, edu_collection: AsyncIOMotorCollection = Depends(get_educational_content_collection)):
-    content_doc = await edu_collection.find_one({"content": {"$exists": True}})
-    if not content_doc or year not in content_doc["content"] or term not in content_doc["content"][year] or language not in content_doc["content"][year][term] or subject not in content_doc["content"][year][term][language]:
-        return []
-
-    content = content_doc["content"][year][term][language][subject]
-    lessons_data = content.get("lessons", {})
-    chapters_data = content.get("chapters", {})
-
-    free_lessons = []
-    for lesson_id, lesson_data in lessons_data.items():
-        if lesson_data.get('isFree', False):
-            price_str = lesson_data.get("price", "0 جنية").split()[0]
-            try:
-                price_val = float(price_str)
-            except (ValueError, IndexError):
-                price_val = 0.0
-            
-            chapter_title = chapters_data.get(str(lesson_data.get("chapter_id")), {}).get("title")
-
-            free_lessons.append(LessonResponseV2(
-                id=str(lesson_id),
-                title=lesson_data.get("title"),
-                description=lesson_data.get("description", ""),
-                vimeo_embed_src=lesson_data.get("vimeo_embed_src"),
-                image_url=lesson_data.get("image_url"),
-                price=price_val,
-                hours=lesson_data.get("hours", 0),
-                lecture=lesson_data.get("lecture", ""),
-                course=f"{chapter_title} ({lesson_data.get('chapter_id')})" if chapter_title else ""
-            ))
-    return free_lessons
+async def get_free_chapters(request: Request, year: str, term: str, language: str, subject: str):
+    return catalog_responder.respond(request, await render_cache.lessons((year, term, language, subject), "free"))
 
 ############ GET Paid Chapters ################
 @app.get("/homepage/{year}/{term}/{language}/{subject}/paid", response_model=List[LessonResponseV2])
-async def get_paid_chapters(year: str, term: str, language: str, subject: str, edu_collection: AsyncIOMotorCollection = Depends(get_educational_content_collection)):
-    content_doc = await edu_collection.find_one({"content": {"$exists": True}})
-    if not content_doc or year not in content_doc["content"] or term not in content_doc["content"][year] or language not in content_doc["content"][year][term] or subject not in content_doc["content"][year][term][language]:
-        return []
-
-    content = content_doc["content"][year][term][language][subject]
-    lessons_data = content.get("lessons", {})
-    chapters_data = content.get("chapters", {})
-
-    paid_lessons = []
-    for lesson_id, lesson_data in lessons_data.items():
-        if not lesson_data.get('isFree', False):
-            price_str = lesson_data.get("price", "0 جنية").split()[0]
-            try:
-                price_val = float(price_str)
-            except (ValueError, IndexError):
-                price_val = 0.0
-
-            chapter_title = chapters_data.get(str(lesson_data.get("chapter_id")), {}).get("title")
-
-            paid_lessons.append(LessonResponseV2(
-                id=str(lesson_id),
-                title=lesson_data.get("title"),
-                description=lesson_data.get("description", ""),
-                vimeo_embed_src=lesson_data.get("vimeo_embed_src"),
-                image_url=lesson_data.get("image_url"),
-                price=price_val,
-                hours=lesson_data.get("hours", 0),
-                lecture=lesson_data.get("lecture", ""),
-                course=f"{chapter_title} ({lesson_data.get('chapter_id')})" if chapter_title else ""
-            ))
-    return paid_lessons
+async def get_paid_chapters(request: Request, year: str, term: str, language: str, subject: str):
+    return catalog_responder.respond(request, await render_cache.lessons((year, term, language, subject), "paid"))
 
 
 
 # --- BOOKS ENDPOINT ---
 @app.get("/books", response_model=List[BookResponse])
-async def get_books(books_collection: AsyncIOMotorCollection = Depends(get_books_collection)):
-    books = await books_collection.find().to_list(1000)
-    # Pydantic will handle the mapping from _id to id if necessary
-    return books
+async def get_books(request: Request, page: PageParams = Depends(page_params)):
+    return catalog_responder.respond(request, await render_cache.books(page))
 
 @app.post("/dashboard/buy-item", response_model=ReceiptResponse)
 async def buy_item(
     purchase_data: ItemPurchaseRequest,
-    current_student: dict = Depends(get_current_student),
+    current_student: dict = Depends(get_current_principal),
     receipt_collection: AsyncIOMotorCollection = Depends(get_receipt_collection),
     edu_collection: AsyncIOMotorCollection = Depends(get_educational_content_collection)
 ):
@@ -1165,70 +1093,36 @@ async def buy_item(
     }
 
     result = await receipt_collection.insert_one(new_receipt_data)
+    await record_receipt(new_receipt_data)
+    await grant_from_receipt(new_receipt_data)
     created_receipt = await receipt_collection.find_one({"_id": result.inserted_id})
     created_receipt["_id"] = str(created_receipt["_id"])
     return created_receipt
 
 
 @app.get("/dashboard/my-chapters", response_model=List[LessonResponseV2])
-async def get_my_chapters(
-    current_student: dict = Depends(get_current_student),
-    receipt_collection: AsyncIOMotorCollection = Depends(get_receipt_collection),
-    edu_collection: AsyncIOMotorCollection = Depends(get_educational_content_collection)
-):
+async def get_my_chapters(current_student: dict = Depends(get_current_principal)):
     """
     Gets all lessons belonging to the chapters the authenticated student
-    has paid for by checking their receipts.
+    has paid for, grouped by chapter.
     """
-    receipts_cursor = receipt_collection.find({
-        "student_code": current_student["student_code"],
-        "receipt_type": "package_purchase"
-    })
-    receipts = await receipts_cursor.to_list(length=1000)
-    purchased_chapter_ids = {int(r["item_id"]) for r in receipts}
+    purchased = await purchased_chapter_ids(current_student["student_code"])
 
-    edu_doc = await edu_collection.find_one({"content": {"$exists": True}})
-    if not edu_doc:
+    index = await content_cache.get_index()
+    if index is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Educational content not found.")
-    content = edu_doc.get("content", {})
 
     my_lessons = []
-    for year in content.values():
-        for term in year.values():
-            for language in term.values():
-                for subject in language.values():
-                    # Check if the lessons exist in the subject dictionary
-                    for lesson_id, lesson_data in subject.get("lessons", {}).items():
-                        # The database stores IDs as strings, so convert for comparison
-                        if int(lesson_data.get("chapter_id")) in purchased_chapter_ids:
-                            # Safely extract the price and convert to float
-                            price_str = lesson_data.get("price", "0 جنية").split()[0]
-                            try:
-                                price_val = float(price_str)
-                            except (ValueError, IndexError):
-                                price_val = 0.0
-
-                            # Get the chapter title for the 'course' field
-                            chapter_title = subject.get("chapters", {}).get(str(lesson_data.get("chapter_id")), {}).get("title")
-
-                            # Append the lesson to the list using the desired schema
-                            my_lessons.append(LessonResponseV2(
-                                id=str(lesson_id),
-                                title=lesson_data.get("title"),
-                                description=lesson_data.get("description", ""),
-                                vimeo_embed_src=lesson_data.get("vimeo_embed_src"),
-                                image_url=lesson_data.get("image_url"),
-                                price=price_val,
-                                hours=lesson_data.get("hours", 0),
-                                lecture=lesson_data.get("lecture", ""),
-                                course=f"{chapter_title} ({lesson_data.get('chapter_id')})" if chapter_title else ""
-                            ))
-                            
+    for chapter_id in sorted(purchased):
+        for path, lesson_id, lesson_data in index.chapter_lessons.get(chapter_id, []):
+            chapters_data = index.subjects.get(path, {}).get("chapters", {})
+            my_lessons.append(render_lesson(lesson_id, lesson_data, chapters_data))
+
     return my_lessons
 
 @app.get("/dashboard/my-tests", response_model=List[TestResultResponse])
 async def get_my_tests(
-    current_student: dict = Depends(get_current_student),
+    current_student: dict = Depends(get_current_principal),
     tests_collection: AsyncIOMotorCollection = Depends(get_mock_test_results_collection)
 ):
     """
@@ -1245,7 +1139,7 @@ async def get_my_tests(
 @app.post("/dashboard/add-test-result", response_model=TestResultResponse)
 async def add_test_result(
     test_data: AddTestResultRequest,
-    current_student: dict = Depends(get_current_student),
+    current_student: dict = Depends(get_current_principal),
     tests_collection: AsyncIOMotorCollection = Depends(get_mock_test_results_collection)
 ):
     """
@@ -1281,7 +1175,7 @@ async def add_test_result(
 @app.post("/dashboard/favorites/add", status_code=status.HTTP_201_CREATED)
 async def add_favorite_video(
     fav_request: FavoriteVideoRequest,
-    current_student: dict = Depends(get_current_student),
+    current_student: dict = Depends(get_current_principal),
     favorites_collection: AsyncIOMotorCollection = Depends(get_favorite_videos_collection),
     videos_collection: AsyncIOMotorCollection = Depends(get_mock_videos_collection)
 ):
@@ -1307,7 +1201,7 @@ async def add_favorite_video(
 
 @app.get("/dashboard/favorites", response_model=List[VideoResponse])
 async def get_my_favorite_videos(
-    current_student: dict = Depends(get_current_student),
+    current_student: dict = Depends(get_current_principal),
     favorites_collection: AsyncIOMotorCollection = Depends(get_favorite_videos_collection),
     videos_collection: AsyncIOMotorCollection = Depends(get_mock_videos_collection)
 ):
@@ -1330,9 +1224,7 @@ async def get_my_favorite_videos(
 async def get_parent_dashboard(
     login_data: ParentLoginRequest,
     student_collection: AsyncIOMotorCollection = Depends(get_student_collection),
-    receipt_collection: AsyncIOMotorCollection = Depends(get_receipt_collection),
-    tests_collection: AsyncIOMotorCollection = Depends(get_mock_test_results_collection),
-    edu_collection: AsyncIOMotorCollection = Depends(get_educational_content_collection)
+    tests_collection: AsyncIOMotorCollection = Depends(get_mock_test_results_collection)
 ):
     """
     Provides a comprehensive dashboard for a parent by verifying
@@ -1357,26 +1249,16 @@ async def get_parent_dashboard(
     test_results = await tests_cursor.to_list(length=1000)
 
     # 3. Get the student's purchased chapters from the database
-    receipts_cursor = receipt_collection.find({
-        "student_code": student_code,
-        "receipt_type": "package_purchase"
-    })
-    receipts = await receipts_cursor.to_list(length=1000)
-    purchased_item_ids = {int(r["item_id"]) for r in receipts}
+    purchased_item_ids = await purchased_chapter_ids(student_code)
 
-    edu_doc = await edu_collection.find_one({"content": {"$exists": True}})
+    index = await content_cache.get_index()
     purchased_chapters = []
-    if edu_doc:
-        content = edu_doc.get("content", {})
-        for year in content.values():
-            for term in year.values():
-                for language in term.values():
-                    for subject in language.values():
-                        for cid, cdata in subject.get("chapters", {}).items():
-                            if int(cid) in purchased_item_ids:
-                                purchased_chapters.append(
-                                    ChapterSummaryResponse(id=int(cid), image=courseImg, variant="chapter", **cdata)
-                                )
+    if index:
+        for cid in sorted(purchased_item_ids):
+            for _, cdata in index.chapters.get(cid, []):
+                purchased_chapters.append(
+                    ChapterSummaryResponse(id=cid, image=courseImg, variant="chapter", **cdata)
+                )
     
     student = format_student_grade(student)
     # 4. Assemble and return the complete dashboard response
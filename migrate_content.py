@@ -0,0 +1,69 @@
+# migrate_content.py
+# One-shot copy of the educational_content document into the chapters / lessons collections.
+# Safe to re-run: every chapter and lesson is upserted on its (year, term, language, subject, id) key.
+#
+#   python3 migrate_content.py --dry-run
+#   python3 migrate_content.py
+#   CONTENT_BACKEND=collections uvicorn main:app ...
+import sys
+import asyncio
+
+from pymongo import ReplaceOne
+
+from database import connect_to_mongo, close_mongo_connection, get_chapters_collection, get_lessons_collection
+from content_store import DocumentContentStore, CollectionsContentStore
+
+BATCH_SIZE = 1000
+
+
+def build_operations(content: dict):
+    chapter_ops, lesson_ops, skipped = [], [], []
+    for year, year_content in content.items():
+        for term, term_content in year_content.items():
+            for language, lang_content in term_content.items():
+                for subject, subject_content in lang_content.items():
+                    key = {"year": year, "term": term, "language": language, "subject": subject}
+                    for kind, ops in (("chapters", chapter_ops), ("lessons", lesson_ops)):
+                        for node_id, node in subject_content.get(kind, {}).items():
+                            try:
+                                doc_key = {**key, "id": int(node_id)}
+                            except ValueError:
+                                skipped.append(f"{year}/{term}/{language}/{subject}/{kind}/{node_id}")
+                                continue
+                            ops.append(ReplaceOne(doc_key, {**doc_key, **node}, upsert=True))
+    return chapter_ops, lesson_ops, skipped
+
+
+async def write_in_batches(collection, ops):
+    for start in range(0, len(ops), BATCH_SIZE):
+        await collection.bulk_write(ops[start:start + BATCH_SIZE], ordered=False)
+
+
+async def migrate(dry_run: bool):
+    await connect_to_mongo()
+    try:
+        content, version = await DocumentContentStore().load()
+        if content is None:
+            print("No educational_content document found; nothing to migrate.")
+            return
+        chapter_ops, lesson_ops, skipped = build_operations(content)
+        print(f"Found {len(chapter_ops)} chapters and {len(lesson_ops)} lessons (content version {version}).")
+        for path in skipped:
+            print(f"Skipping non-numeric id: {path}")
+        if dry_run:
+            print("Dry run; nothing written.")
+            return
+
+        store = CollectionsContentStore()
+        await store.ensure_indexes()
+        await write_in_batches(await get_chapters_collection(), chapter_ops)
+        await write_in_batches(await get_lessons_collection(), lesson_ops)
+        # Makes running workers on the collections backend reload
+        await store.bump_version()
+        print("Migration complete.")
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate(dry_run="--dry-run" in sys.argv))
@@ -0,0 +1,143 @@
+# mongo_metrics.py
+import time
+import threading
+from collections import defaultdict
+
+from pymongo import monitoring
+
+
+class MongoMetrics(monitoring.ConnectionPoolListener, monitoring.CommandListener):
+    """Connection-pool and command-latency counters fed by pymongo's monitoring hooks.
+
+    Motor runs pymongo on executor threads, so callbacks can arrive concurrently; all
+    counters are updated under one lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # A checkout starts and completes on the same thread, so its start time is thread-local
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connections_open = 0
+            self.connections_created = 0
+            self.connections_closed = 0
+            self.in_use = 0
+            self.peak_in_use = 0
+            self.waiting = 0
+            self.peak_waiting = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.checkout_wait_total = 0.0
+            self.checkout_wait_max = 0.0
+            self.pool_clears = 0
+            self.commands = defaultdict(lambda: {"count": 0, "failures": 0, "total_ms": 0.0, "max_ms": 0.0})
+
+    # --- ConnectionPoolListener ---
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_open += 1
+            self.connections_created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_open -= 1
+            self.connections_closed += 1
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+
+    def _checkout_finished(self) -> float:
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        self.waiting -= 1
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._checkout_finished()
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            wait = self._checkout_finished()
+            self.checkouts += 1
+            self.checkout_wait_total += wait
+            self.checkout_wait_max = max(self.checkout_wait_max, wait)
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    # --- CommandListener ---
+    def started(self, event):
+        pass
+
+    def _record(self, event, failed: bool):
+        ms = event.duration_micros / 1000
+        with self._lock:
+            command = self.commands[event.command_name]
+            command["count"] += 1
+            command["failures"] += failed
+            command["total_ms"] += ms
+            command["max_ms"] = max(command["max_ms"], ms)
+
+    def succeeded(self, event):
+        self._record(event, failed=False)
+
+    def failed(self, event):
+        self._record(event, failed=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pool": {
+                    "connections_open": self.connections_open,
+                    "connections_created": self.connections_created,
+                    "connections_closed": self.connections_closed,
+                    "in_use": self.in_use,
+                    "peak_in_use": self.peak_in_use,
+                    "waiting": self.waiting,
+                    "peak_waiting": self.peak_waiting,
+                    "checkouts": self.checkouts,
+                    "checkout_failures": self.checkout_failures,
+                    "checkout_wait_avg_ms": round(self.checkout_wait_total / self.checkouts * 1000, 3) if self.checkouts else None,
+                    "checkout_wait_max_ms": round(self.checkout_wait_max * 1000, 3),
+                    "pool_clears": self.pool_clears,
+                },
+                "commands": {
+                    name: {
+                        "count": c["count"],
+                        "failures": c["failures"],
+                        "avg_ms": round(c["total_ms"] / c["count"], 3),
+                        "max_ms": round(c["max_ms"], 3),
+                    }
+                    for name, c in sorted(self.commands.items())
+                },
+            }
+
+
+mongo_metrics = MongoMetrics()
@@ -0,0 +1,105 @@
+# pagination.py
+import os
+import base64
+from datetime import datetime
+from typing import Optional
+
+from bson import ObjectId, json_util
+from fastapi import HTTPException, Query, Response, status
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ASCENDING, DESCENDING
+
+# The list routes returned up to 1000 rows before they were paginated; clients that don't
+# follow X-Next-Cursor (e.g. frontend/try.html) still get that much by default
+PAGE_LIMIT_DEFAULT = int(os.environ.get("PAGE_LIMIT_DEFAULT", "1000"))
+PAGE_LIMIT_MAX = int(os.environ.get("PAGE_LIMIT_MAX", "1000"))
+# Response header carrying the cursor of the next page; absent on the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# What a cursor may hold: the sort value (a date, or None when the field is missing) and the _id.
+# Anything else, such as {"$ne": null} or {"$where": ...}, would be an operator in the keyset query
+CURSOR_VALUE_TYPES = (ObjectId, datetime, str, int, float, type(None))
+
+
+class PageParams:
+    def __init__(self, limit: int, cursor: Optional[str]):
+        self.limit = limit
+        self.cursor = cursor
+
+
+async def page_params(
+    limit: int = Query(PAGE_LIMIT_DEFAULT, ge=1, le=PAGE_LIMIT_MAX),
+    cursor: Optional[str] = Query(None)
+) -> PageParams:
+    return PageParams(limit, cursor)
+
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> list:
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except Exception:
+        values = None
+    if not isinstance(values, list) or not values or not all(isinstance(v, CURSOR_VALUE_TYPES) for v in values):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid cursor.")
+    if values[-1] is None:
+        # The last value is always the _id
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid cursor.")
+    return values
+
+
+async def find_page(
+    collection: AsyncIOMotorCollection,
+    query: dict,
+    page: PageParams,
+    sort_field: str = None,
+    projection: dict = None
+) -> tuple:
+    """Returns (docs, next cursor or None) for one page of `query`.
+
+    Without `sort_field` pages run oldest-first by _id; with it they run newest-first by
+    (sort_field, _id). Either way each page is an index range scan from the previous
+    page's last key, so deep pages cost the same as the first.
+    """
+    if sort_field:
+        sort = [(sort_field, DESCENDING), ("_id", DESCENDING)]
+    else:
+        sort = [("_id", ASCENDING)]
+
+    if page.cursor:
+        after = decode_cursor(page.cursor)
+        if sort_field:
+            if len(after) != 2:
+                raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid cursor.")
+            value, last_id = after
+            keyset = {"$or": [{sort_field: {"$lt": value}}, {sort_field: value, "_id": {"$lt": last_id}}]}
+        else:
+            keyset = {"_id": {"$gt": after[0]}}
+        query = {"$and": [query, keyset]} if query else keyset
+
+    docs = await collection.find(query, projection).sort(sort).limit(page.limit + 1).to_list(page.limit + 1)
+    next_cursor = None
+    if len(docs) > page.limit:
+        docs = docs[:page.limit]
+        last = docs[-1]
+        next_cursor = encode_cursor([last.get(sort_field), last["_id"]] if sort_field else [last["_id"]])
+    for doc in docs:
+        doc["_id"] = str(doc["_id"])
+    return docs, next_cursor
+
+
+async def fetch_page(
+    collection: AsyncIOMotorCollection,
+    query: dict,
+    page: PageParams,
+    response: Response,
+    sort_field: str = None,
+    projection: dict = None
+) -> list:
+    """find_page for routes: returns the docs and sets the next-page cursor header."""
+    docs, next_cursor = await find_page(collection, query, page, sort_field, projection)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return docs
@@ -0,0 +1,123 @@
+# passwords.py
+import os
+import time
+import asyncio
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from passlib.hash import bcrypt
+
+# "thread" shares the worker's GIL between hashing and request handling,
+# "process" moves bcrypt onto its own cores
+PASSWORD_HASH_BACKEND = os.environ.get("PASSWORD_HASH_BACKEND", "thread")
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", "4"))
+# Hash/verify calls allowed to wait for a worker before new ones are rejected with 503
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", "64"))
+
+# bcrypt cost per kind of secret. Reset codes live for 10 minutes and are deleted after
+# one successful check, so they don't need the full account-password cost.
+BCRYPT_ROUNDS = {
+    "password": int(os.environ.get("BCRYPT_ROUNDS", "12")),
+    "reset_code": int(os.environ.get("BCRYPT_RESET_CODE_ROUNDS", "10")),
+}
+
+
+# Module-level so they can be pickled into a process pool
+@lru_cache(maxsize=None)
+def _bcrypt_with_rounds(rounds: int):
+    return bcrypt.using(rounds=rounds)
+
+
+def _hash(password: str, rounds: int) -> str:
+    return _bcrypt_with_rounds(rounds).hash(password)
+
+
+def _verify(plain: str, hashed: str) -> bool:
+    return bcrypt.verify(plain, hashed)
+
+
+def _warm() -> None:
+    _bcrypt_with_rounds(BCRYPT_ROUNDS["password"])
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many hash/verify calls are already queued."""
+
+
+class PasswordHasher:
+    """Runs bcrypt off the event loop on a bounded thread or process pool."""
+
+    def __init__(self, backend: str = PASSWORD_HASH_BACKEND, workers: int = PASSWORD_HASH_WORKERS,
+                 max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.backend = backend
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def start(self):
+        if self._executor is not None:
+            return
+        if self.backend == "process":
+            # spawn, not fork: the parent already runs an event loop and Motor's threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+
+    async def warm_up(self):
+        """Starts every pool worker now so the first logins don't pay for process startup."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _warm) for _ in range(self.workers)))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        self.start()
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.pending -= 1
+            self.completed += 1
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+
+    async def hash(self, password: str, kind: str = "password") -> str:
+        return await self._run(_hash, password, BCRYPT_ROUNDS[kind])
+
+    async def verify(self, plain: str, hashed: str) -> bool:
+        return await self._run(_verify, plain, hashed)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "peak_pending": self.peak_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_ms": round(self.total_seconds / self.completed * 1000, 2) if self.completed else None,
+            "max_ms": round(self.max_seconds * 1000, 2),
+        }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,235 @@
+# render_cache.py
+import os
+import time
+import hashlib
+from typing import List
+from collections import OrderedDict
+
+from fastapi import HTTPException, status
+from pydantic import TypeAdapter
+
+from compression import compressor
+from content_cache import content_cache
+from database import get_books_collection
+from pagination import PageParams, find_page
+from schemas import LessonResponseV2, BookResponse
+from singleflight import SingleFlight
+
+# Rendered catalog payloads kept per worker
+RENDER_CACHE_SIZE = int(os.environ.get("RENDER_CACHE_SIZE", "2048"))
+# Books live in their own collection with no version to watch: admin edits on this worker
+# drop the cached pages at once, other workers pick them up within this many seconds
+BOOKS_CACHE_SECONDS = float(os.environ.get("BOOKS_CACHE_SECONDS", "30"))
+
+LESSON_FILTERS = ("all", "free", "paid")
+
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+# The serializers FastAPI itself uses for these response_models, so cached bytes match
+# what the routes would return without the cache
+_lesson = TypeAdapter(LessonResponseV2)
+_lesson_list = TypeAdapter(List[LessonResponseV2])
+_book_list = TypeAdapter(List[BookResponse])
+
+
+def _price(lesson_data: dict) -> float:
+    price_str = lesson_data.get("price", "0 جنية").split()[0]
+    try:
+        return float(price_str)
+    except (ValueError, IndexError):
+        return 0.0
+
+
+def render_lesson(lesson_id, lesson_data: dict, chapters_data: dict, lecture: str = None, course: str = None) -> LessonResponseV2:
+    """Builds the public view of a lesson; `course` defaults to "<chapter title> (<chapter id>)"."""
+    if course is None:
+        chapter_title = chapters_data.get(str(lesson_data.get("chapter_id")), {}).get("title")
+        course = f"{chapter_title} ({lesson_data.get('chapter_id')})" if chapter_title else ""
+
+    return LessonResponseV2(
+        id=str(lesson_id),
+        title=lesson_data.get("title"),
+        description=lesson_data.get("description", ""),
+        vimeo_embed_src=lesson_data.get("vimeo_embed_src"),
+        image_url=lesson_data.get("image_url"),
+        price=_price(lesson_data),
+        hours=lesson_data.get("hours", 0),
+        lecture=lesson_data.get("lecture", "") if lecture is None else lecture,
+        course=course
+    )
+
+
+class RenderedPayload:
+    def __init__(self, body: bytes, next_cursor: str = None):
+        self.body = body
+        self.etag = _etag(body)
+        self.next_cursor = next_cursor
+        self._encoded = {}          # coding -> compressed body, built on first use
+
+    def encoded(self, coding: str) -> bytes:
+        """The body compressed with `coding`, at the slow/high ratio settings since it's done once."""
+        body = self._encoded.get(coding)
+        if body is None:
+            body = self._encoded[coding] = compressor.compress(self.body, coding, cached=True)
+        return body
+
+
+EMPTY_LIST = RenderedPayload(b"[]")
+
+
+class CatalogRenderCache:
+    """Final JSON bytes (and their ETag) of the public catalog routes.
+
+    Content entries belong to one load of the content cache; the first request after the
+    content is reloaded (i.e. its version changed) drops them all and renders afresh.
+    Book pages expire after BOOKS_CACHE_SECONDS or on invalidate_books().
+    """
+
+    def __init__(self, maxsize: int = RENDER_CACHE_SIZE, books_ttl: float = BOOKS_CACHE_SECONDS):
+        self.maxsize = maxsize
+        self.books_ttl = books_ttl
+        self._entries = OrderedDict()
+        self._books = {}            # (limit, cursor) -> (expires_at, payload)
+        self._books_generation = 0
+        self._generation = None
+        self._book_flight = SingleFlight("books")
+        self.hits = 0
+        self.renders = 0
+        self.resets = 0
+        self.book_hits = 0
+        self.book_loads = 0
+
+    async def _index(self):
+        index = await content_cache.get_index()
+        # Every reload builds a new content dict, so the reload count identifies the content
+        if content_cache.reloads != self._generation:
+            self._entries.clear()
+            self._generation = content_cache.reloads
+            self.resets += 1
+        return index
+
+    def _get(self, key):
+        payload = self._entries.get(key)
+        if payload is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return payload
+
+    def _put(self, key, body: bytes) -> RenderedPayload:
+        payload = RenderedPayload(body)
+        self.renders += 1
+        self._entries[key] = payload
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return payload
+
+    # --- Content routes ---
+
+    async def lessons(self, path: tuple, lesson_filter: str) -> RenderedPayload:
+        """/homepage lesson list of one subject; unknown subjects render as []."""
+        index = await self._index()
+        key = ("subject", path, lesson_filter)
+        payload = self._get(key)
+        if payload is not None:
+            return payload
+        subject_content = index.subjects.get(path) if index else None
+        if subject_content is None:
+            # Unknown subjects aren't cached, so arbitrary URLs can't fill the cache
+            return EMPTY_LIST
+        chapters_data = subject_content.get("chapters", {})
+        items = []
+        for lesson_id, lesson_data in subject_content.get("lessons", {}).items():
+            is_free = lesson_data.get("isFree", False)
+            if (lesson_filter == "free" and not is_free) or (lesson_filter == "paid" and is_free):
+                continue
+            items.append(render_lesson(lesson_id, lesson_data, chapters_data))
+        return self._put(key, _lesson_list.dump_json(items))
+
+    async def chapter(self, chapter_id: int) -> RenderedPayload:
+        """/chapters/{id}: lessons of every subject filed under the chapter id."""
+        index = await self._index()
+        key = ("chapter", chapter_id)
+        payload = self._get(key)
+        if payload is not None:
+            return payload
+        if index is None:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, "Educational content not found.")
+        chapter_entry = index.chapter(chapter_id)
+        if not chapter_entry:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, "Chapter not found.")
+        course = f"{chapter_entry[1]['title']} ({chapter_id})"
+        items = [
+            render_lesson(lesson_id, lesson_data, {}, lecture=f"Lecture {lesson_id}", course=course)
+            for _, lesson_id, lesson_data in index.chapter_lessons.get(chapter_id, [])
+        ]
+        if not items:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, "Chapter has no lessons.")
+        return self._put(key, _lesson_list.dump_json(items))
+
+    async def lesson(self, lesson_id: int) -> RenderedPayload:
+        """/lessons/{id}"""
+        index = await self._index()
+        key = ("lesson", lesson_id)
+        payload = self._get(key)
+        if payload is not None:
+            return payload
+        if index is None:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, "Educational content not found.")
+        lesson_entry = index.lesson(lesson_id)
+        if not lesson_entry:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, "Lesson not found.")
+        lesson_path, lesson_data = lesson_entry
+        chapters_data = index.subjects.get(lesson_path, {}).get("chapters", {})
+        lesson = render_lesson(lesson_id, lesson_data, chapters_data, lecture=f"Lecture {lesson_id}")
+        return self._put(key, _lesson.dump_json(lesson))
+
+    # --- Books ---
+
+    async def books(self, page: PageParams) -> RenderedPayload:
+        """One /books page; next_cursor is set when there are more."""
+        key = (page.limit, page.cursor)
+        entry = self._books.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.book_hits += 1
+            return entry[1]
+        # Requests that miss together (e.g. right after expiry) share one query
+        return await self._book_flight.do(key, self._load_books, key, page)
+
+    async def _load_books(self, key: tuple, page: PageParams) -> RenderedPayload:
+        generation = self._books_generation
+        docs, next_cursor = await find_page(await get_books_collection(), {}, page)
+        # Validated like response_model does: drops _id and any stored field BookResponse doesn't declare
+        payload = RenderedPayload(_book_list.dump_json(_book_list.validate_python(docs)), next_cursor)
+        self.book_loads += 1
+        # A page read before an admin edit on this worker is served but not kept
+        if generation == self._books_generation:
+            if len(self._books) >= self.maxsize:
+                self._books.clear()
+            self._books[key] = (time.monotonic() + self.books_ttl, payload)
+        return payload
+
+    def invalidate_books(self):
+        self._books.clear()
+        self._books_generation += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.renders
+        book_lookups = self.book_hits + self.book_loads
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "renders": self.renders,
+            "resets": self.resets,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "book_pages": len(self._books),
+            "book_hits": self.book_hits,
+            "book_loads": self.book_loads,
+            "book_hit_rate": round(self.book_hits / book_lookups, 4) if book_lookups else None,
+        }
+
+
+render_cache = CatalogRenderCache()
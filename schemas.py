@@ -1,9 +1,12 @@
 # schemas.py
-from pydantic import BaseModel, Field, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field, EmailStr
+from typing import Annotated, Optional, List
 from datetime import datetime
 from bson import ObjectId
 
+# Mongo _id as it goes out in responses; routes can pass the raw ObjectId
+ObjectIdStr = Annotated[str, BeforeValidator(lambda v: str(v) if isinstance(v, ObjectId) else v)]
+
 class RegisterRequest(BaseModel):
     name: str
     phone: str
@@ -56,7 +59,9 @@ class ReceiptCreate(BaseModel):
     description: str
 
 class ReceiptResponse(BaseModel):
-    id: str = Field(alias="_id")
+    model_config = ConfigDict(populate_by_name=True)
+
+    id: ObjectIdStr = Field(alias="_id")
     student_id: str
     student_code: str
     receipt_type: str
@@ -65,11 +70,6 @@ class ReceiptResponse(BaseModel):
     description: str
     created_at: datetime
 
-    class Config:
-        arbitrary_types_allowed = True
-        json_encoders = { ObjectId: str }
-        allow_population_by_field_name = True
-
 class ForgotPasswordRequest(BaseModel):
     email: EmailStr
 
@@ -202,7 +202,9 @@ class AdminRegisterRequest(BaseModel):
     role: str = "admin"
 
 class AdminProfileResponse(BaseModel):
-    id: str = Field(alias="_id")
+    model_config = ConfigDict(populate_by_name=True)
+
+    id: ObjectIdStr = Field(alias="_id")
     email: EmailStr
     name: Optional[str] = None
     role: str
@@ -267,7 +269,9 @@ class TeacherLoginRequest(BaseModel):
     password: str
 
 class TeacherProfileResponse(BaseModel):
-    id: str = Field(alias="_id")
+    model_config = ConfigDict(populate_by_name=True)
+
+    id: ObjectIdStr = Field(alias="_id")
     name: str
     email: EmailStr
     phone: Optional[str] = None
@@ -0,0 +1,55 @@
+# singleflight.py
+import asyncio
+
+_groups = {}
+
+
+class SingleFlight:
+    """Collapses concurrent identical loads into one awaited task.
+
+    The first caller for a key starts `fn()`; callers arriving while it runs await the same
+    task instead of repeating the work. Once it finishes the key is free again, so this
+    deduplicates in-flight work only and never serves an old result.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight = {}
+        self.calls = 0          # loads actually started
+        self.coalesced = 0      # callers that joined a load already in flight
+        self.errors = 0
+        self.peak_waiters = 0
+        _groups[name] = self
+
+    async def do(self, key, fn, *args):
+        entry = self._inflight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(fn(*args))
+            entry = self._inflight[key] = [task, 1]
+            task.add_done_callback(lambda t: self._done(key, t))
+            self.calls += 1
+        else:
+            entry[1] += 1
+            self.coalesced += 1
+            self.peak_waiters = max(self.peak_waiters, entry[1])
+        # A waiter that gets cancelled (client went away) must not cancel the load for the rest
+        return await asyncio.shield(entry[0])
+
+    def _done(self, key, task):
+        if self._inflight.get(key, [None])[0] is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "peak_waiters": self.peak_waiters,
+        }
+
+
+def stats() -> dict:
+    return {name: group.stats() for name, group in _groups.items()}
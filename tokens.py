@@ -0,0 +1,44 @@
+# tokens.py
+import os
+import time
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+from jose import JWTError, jwt
+
+from caching import TTLCache
+
+SECRET_KEY = "Ea$yB1o"
+ALGORITHM = "HS256"
+
+# Verified payloads keyed by token digest; each entry lives until the token's own exp
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "50000"))
+token_cache = TTLCache(TOKEN_CACHE_SIZE, ttl=0)
+
+
+def create_token(data: dict, expires_delta: timedelta):
+    to_encode = data.copy()
+    expire = datetime.now(timezone.utc) + expires_delta
+    to_encode.update({"exp": expire})
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def token_hash(token: str) -> str:
+    """Stable digest used to store and look up tokens without keeping the token itself."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def decode_token(token: str):
+    """Returns the verified claims of token, or None if it is invalid or expired."""
+    key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(key)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            token_cache.set(key, payload, ttl=exp - time.time())
+    # Callers shouldn't be able to change what the next request sees
+    return dict(payload)
@@ -6,6 +6,8 @@ from datetime import datetime, timedelta
 import random
 import string
 
+import tokens
+
 def generate_student_code():
     return "STU" + ''.join(random.choices(string.digits, k=6))
 
@@ -32,8 +34,4 @@ def get_password_hash(password):
 
 
 def decode_access_token(token: str):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
-        return None
+    return tokens.decode_token(token)